@@ -0,0 +1,80 @@
+# Augmentation de données à la volée, vectorisée sur des batches entiers.
+# Reprend les transformations de augment_data_and_save (rotation, décalage, cisaillement,
+# zoom, miroir horizontal, remplissage 'nearest') mais les applique en mémoire pendant
+# l'entraînement : chaque époque voit de nouvelles variantes, sans écrire de fichiers.
+import numpy as np
+
+
+class BatchAugmenter:
+    def __init__(self, rotation_range=30, width_shift_range=0.2, height_shift_range=0.2,
+                 shear_range=0.2, zoom_range=0.2, horizontal_flip=True,
+                 interpolation='bilinear', seed=None):
+        if interpolation not in ('bilinear', 'nearest'):
+            raise ValueError(f"Interpolation inconnue : {interpolation}")
+        self.rotation_range = rotation_range
+        self.width_shift_range = width_shift_range
+        self.height_shift_range = height_shift_range
+        self.shear_range = shear_range # En degrés, comme ImageDataGenerator
+        self.zoom_range = zoom_range
+        self.horizontal_flip = horizontal_flip
+        self.interpolation = interpolation
+        self.rng = np.random.default_rng(seed)
+
+    # Tire les paramètres de chaque image et renvoie, pour chaque pixel de sortie,
+    # les coordonnées (ligne, colonne) à lire dans l'image source : deux tableaux (N, H, W)
+    def _source_coords(self, n, h, w):
+        rng = self.rng
+        theta = np.deg2rad(rng.uniform(-self.rotation_range, self.rotation_range, n))
+        shear = np.deg2rad(rng.uniform(-self.shear_range, self.shear_range, n))
+        zy, zx = rng.uniform(1 - self.zoom_range, 1 + self.zoom_range, (2, n))
+        ty = rng.uniform(-self.height_shift_range, self.height_shift_range, n) * h
+        tx = rng.uniform(-self.width_shift_range, self.width_shift_range, n) * w
+
+        # Matrice (N, 2, 2) = rotation @ cisaillement @ zoom, appliquée autour du centre
+        cos, sin = np.cos(theta), np.sin(theta)
+        m00 = cos * zy
+        m01 = (-sin * np.cos(shear) - cos * np.sin(shear)) * zx
+        m10 = sin * zy
+        m11 = (cos * np.cos(shear) - sin * np.sin(shear)) * zx
+
+        cy, cx = (h - 1) / 2, (w - 1) / 2
+        yc = (np.arange(h, dtype=np.float32) - cy)[None, :, None]
+        xc = np.broadcast_to((np.arange(w, dtype=np.float32) - cx)[None, None, :], (n, 1, w))
+        if self.horizontal_flip:
+            flip = rng.random(n) < 0.5
+            xc = np.where(flip[:, None, None], -xc, xc)
+
+        col = lambda v: v[:, None, None].astype(np.float32)
+        src_y = col(m00) * yc + col(m01) * xc + col(cy + ty)
+        src_x = col(m10) * yc + col(m11) * xc + col(cx + tx)
+        return src_y, src_x
+
+    # Applique une transformation aléatoire différente à chaque image du batch (N, H, W, C).
+    # Le type du tableau est conservé.
+    def __call__(self, x):
+        n, h, w = x.shape[:3]
+        src_y, src_x = self._source_coords(n, h, w)
+        batch = np.arange(n)[:, None, None]
+
+        if self.interpolation == 'nearest':
+            iy = np.clip(np.rint(src_y), 0, h - 1).astype(np.intp)
+            ix = np.clip(np.rint(src_x), 0, w - 1).astype(np.intp)
+            return x[batch, iy, ix]
+
+        # Bilinéaire : les coordonnées hors image sont ramenées au bord (fill_mode='nearest')
+        src_y = np.clip(src_y, 0, h - 1)
+        src_x = np.clip(src_x, 0, w - 1)
+        y0 = np.floor(src_y).astype(np.intp)
+        x0 = np.floor(src_x).astype(np.intp)
+        y1 = np.minimum(y0 + 1, h - 1)
+        x1 = np.minimum(x0 + 1, w - 1)
+        wy = (src_y - y0)[..., None]
+        wx = (src_x - x0)[..., None]
+
+        xf = x.astype(np.float32, copy=False)
+        top = xf[batch, y0, x0] * (1 - wx) + xf[batch, y0, x1] * wx
+        bottom = xf[batch, y1, x0] * (1 - wx) + xf[batch, y1, x1] * wx
+        out = top * (1 - wy) + bottom * wy
+        if np.issubdtype(x.dtype, np.integer):
+            return np.rint(out).astype(x.dtype)
+        return out.astype(x.dtype, copy=False)
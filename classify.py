@@ -0,0 +1,203 @@
+# Classification en masse : parcourt des dossiers (récursivement) ou lit des chemins sur
+# l'entrée standard, et écrit une ligne de résultat par image en CSV ou JSONL au fil de l'eau.
+# Le décodage et le redimensionnement se font dans un pool de threads, directement dans des
+# batches float32 préalloués, pendant que le modèle prédit le batch courant, et l'écriture dans un thread à part ; toutes les files sont
+# bornées, si bien que la mémoire reste constante quel que soit le nombre d'images.
+#
+#   python classify.py CNN_models/cnn_model_32x32.keras Images_test -o predictions.csv
+#   find /data -name '*.jpg' | python classify.py CNN_models/cnn_model_32x32_float32.tflite - -o out.jsonl
+#
+# Les modèles .tflite sont servis sans importer TensorFlow.
+import os
+import csv
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from itertools import islice
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from model_registry import read_metadata
+from lite_predictor import load_predictor
+from image_loading import BACKENDS, IMAGE_EXTENSIONS
+from preprocessing import BatchBuffer
+
+
+# Parcours récursif paresseux d'un dossier : chemins des images, sans jamais lister tout l'arbre
+def _walk_images(root):
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield entry.path
+        except OSError as e:
+            print(f"Erreur avec le dossier {directory}: {e}", file=sys.stderr)
+
+
+# Chemins à classer : dossiers parcourus, fichiers tels quels, '-' pour l'entrée standard
+def iter_paths(inputs):
+    for source in inputs:
+        if source == '-':
+            for line in sys.stdin:
+                path = line.rstrip('\n')
+                if path:
+                    yield path
+        elif os.path.isdir(source):
+            yield from _walk_images(source)
+        else:
+            yield source
+
+
+# Écrit les résultats dans un thread à part, derrière une file bornée
+class ResultWriter:
+    def __init__(self, output, fmt, class_names, max_pending=1024):
+        self.fmt = fmt
+        self.class_names = class_names
+        self._file = sys.stdout if output == '-' else open(output, 'w', newline='', encoding='utf-8')
+        self._queue = queue.Queue(maxsize=max_pending)
+        if fmt == 'csv':
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(['path', 'class'] + list(class_names) + ['error'])
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, path, probabilities=None, error=None):
+        self._queue.put((path, probabilities, error))
+
+    def _write(self, path, probabilities, error):
+        class_name = None if probabilities is None else self.class_names[int(np.argmax(probabilities))]
+        if self.fmt == 'csv':
+            values = [''] * len(self.class_names) if probabilities is None else [f"{p:.6f}" for p in probabilities]
+            self._csv.writerow([path, class_name or ''] + values + [error or ''])
+        else:
+            record = {'path': path, 'class': class_name}
+            if probabilities is not None:
+                record['probabilities'] = {name: round(float(p), 6) for name, p in zip(self.class_names, probabilities)}
+            if error is not None:
+                record['error'] = error
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            self._write(*item)
+        self._file.flush()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+# Affiche sur stderr le nombre d'images traitées et le débit, au plus toutes les `every` secondes
+class Progress:
+    def __init__(self, every=2.0):
+        self.every = every
+        self.done = 0
+        self.errors = 0
+        self.start = time.perf_counter()
+        self._last = self.start
+
+    def update(self, done=0, errors=0):
+        self.done += done
+        self.errors += errors
+        now = time.perf_counter()
+        if now - self._last >= self.every:
+            self._last = now
+            self._print('\r')
+
+    def _print(self, end):
+        elapsed = time.perf_counter() - self.start
+        print(f"\r{self.done} images, {self.done / max(elapsed, 1e-9):.1f} images/s, {self.errors} erreurs",
+              end=end, file=sys.stderr, flush=True)
+
+    def finish(self):
+        self._print('\n')
+
+
+# Classe toutes les images de `inputs` avec le modèle et écrit les résultats dans output
+# ('-' = sortie standard). prefetch_batches batches préalloués tournent en anneau : pendant
+# que le modèle prédit l'un, les autres se remplissent ; un batch prédit repart aussitôt avec
+# les images suivantes. Renvoie (images classées, erreurs).
+def classify(model_path, inputs, output='-', fmt='csv', batch_size=64, workers=4, class_names=None,
+             prefetch_batches=3, progress_every=2.0, backend='pil'):
+    metadata = read_metadata(model_path)
+    image_size = metadata['image_size']
+    model = load_predictor(model_path)
+    class_names = class_names or metadata['class_names']
+    if class_names is None:
+        width, height = image_size
+        num_classes = int(np.asarray(model.predict_on_batch(np.zeros((1, height, width, 3), np.float32))).shape[-1])
+        class_names = [str(i) for i in range(num_classes)]
+
+    paths = iter_paths(inputs)
+    writer = ResultWriter(output, fmt, class_names)
+    progress = Progress(progress_every)
+    window = deque() # (batch, [(chemin, future du décodage)]), dans l'ordre de lecture
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            def submit(buffer):
+                jobs = [(path, executor.submit(buffer.load_into, i, path))
+                        for i, path in enumerate(islice(paths, batch_size))]
+                if jobs:
+                    window.append((buffer, jobs))
+
+            for _ in range(prefetch_batches):
+                submit(BatchBuffer(batch_size, image_size, backend=backend))
+
+            while window:
+                buffer, jobs = window.popleft()
+                batch_paths, rows = [], []
+                for i, (path, future) in enumerate(jobs):
+                    try:
+                        future.result()
+                        batch_paths.append(path)
+                        rows.append(i)
+                    except Exception as e:
+                        writer.put(path, error=str(e))
+                        progress.update(errors=1)
+
+                if rows:
+                    predictions = np.asarray(model.predict_on_batch(buffer.rows(rows)))
+                    for path, probabilities in zip(batch_paths, predictions):
+                        writer.put(path, probabilities)
+                    progress.update(done=len(rows))
+                submit(buffer) # Les décodeurs restent occupés pendant l'écriture et la prédiction suivante
+    finally:
+        writer.close()
+        progress.finish()
+    return progress.done, progress.errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Classification d'images en masse vers CSV ou JSONL")
+    parser.add_argument('model', help="Fichier .keras, .h5 ou .tflite")
+    parser.add_argument('inputs', nargs='*', default=['-'],
+                        help="Dossiers, fichiers, ou '-' pour lire les chemins sur l'entrée standard (défaut)")
+    parser.add_argument('-o', '--output', default='-', help="Fichier de sortie (défaut : sortie standard)")
+    parser.add_argument('--format', choices=['csv', 'jsonl'],
+                        help="Format de sortie (défaut : d'après l'extension du fichier, sinon csv)")
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=4, help="Threads de décodage")
+    parser.add_argument('--backend', choices=BACKENDS, default='pil',
+                        help="Décodage des images (cv2 : plus rapide, pixels un peu différents de l'entraînement)")
+    parser.add_argument('--classes', nargs='+', help="Noms des classes, si le modèle n'a pas de métadonnées")
+    args = parser.parse_args()
+
+    fmt = args.format or ('jsonl' if args.output.endswith(('.jsonl', '.json')) else 'csv')
+    classify(args.model, args.inputs, args.output, fmt, args.batch_size, args.workers, args.classes,
+             backend=args.backend)
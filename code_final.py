@@ -1,53 +1,168 @@
 # Importation des modules nécessaires pour le CNN et la manipulation des données
+import tensorflow as tf
 from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout
+from tensorflow.keras.layers import Conv2D, SeparableConv2D, MaxPooling2D, Flatten, GlobalAveragePooling2D, Dense, Dropout
 from tensorflow.keras.optimizers import Adam
+from tensorflow.keras.callbacks import Callback, BackupAndRestore, ModelCheckpoint, EarlyStopping, ReduceLROnPlateau
+from tensorflow.keras import mixed_precision
 
 import os
 import numpy as np
 import matplotlib.pyplot as plt
 from sklearn.metrics import confusion_matrix, classification_report, ConfusionMatrixDisplay
 from sklearn.model_selection import train_test_split
-from tensorflow.keras.preprocessing.image import ImageDataGenerator, img_to_array, load_img
+from tensorflow.keras.preprocessing.image import ImageDataGenerator, img_to_array, array_to_img, load_img
 from PIL import Image
 from tqdm import tqdm
 import shutil
-
-import requests
-from io import BytesIO
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+
+from packed_dataset import PackedSequence, DirectorySequence, write_packed
+from split_index import list_class_images, write_index, split_source, INDEX_SUFFIX
+from fetch import ImageFetcher
+from prediction_cache import PredictionCache, image_key, file_sha256
+from model_registry import ModelRegistry, write_metadata, read_metadata, DEFAULT_CLASS_NAMES
+from lite_predictor import export_tflite, quantize_model, benchmark, print_report, QUANTIZED_VARIANTS
+from incremental import run_stage
+from image_loading import resize_one, is_up_to_date
+from preprocessing import preprocess_image, BatchBuffer
+from dedup import origin_name, group_images
 
 # Chemin vers le dossier principal du projet
 PATH = './'
 # Taille à laquelle toutes les images seront redimensionnées
 Image_size = 32
 
+# Applique fn à chaque tâche dans un pool de processus en gardant au plus
+# max_pending tâches en vol, pour ne jamais matérialiser toute la liste en mémoire.
+def _run_in_pool(fn, tasks, workers, max_pending=None):
+    if workers == 1:
+        for task in tasks:
+            yield fn(task)
+        return
+
+    max_pending = max_pending or workers * 4
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for task in tasks:
+            pending.add(executor.submit(fn, task))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in pending:
+            yield future.result()
+
+# Split ('train', 'val' ou 'test') d'une image d'après l'empreinte de sa clé : la même clé
+# tombe toujours dans le même split, quel que soit l'ordre ou le nombre des autres images
+def _stable_split(key, ratios):
+    u = int(hashlib.sha1(key.encode('utf-8')).hexdigest()[:15], 16) / 16 ** 15
+    if u < ratios[0]:
+        return 'train'
+    if u < ratios[0] + ratios[1]:
+        return 'val'
+    return 'test'
+
+SPLIT_MODES = ('index', 'hardlink', 'symlink', 'copy')
+
+# Place src en dst sans copier les octets quand c'est possible : lien physique (repli sur
+# une copie si dst est sur un autre système de fichiers), lien symbolique ou copie
+def _link_file(src, dst, mode):
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if mode == 'hardlink':
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    elif mode == 'symlink':
+        os.symlink(os.path.abspath(src), dst)
+        return
+    shutil.copy2(src, dst)
+
+# Vrai si le processeur a des instructions bfloat16 natives (AVX512_BF16 ou AMX), seul cas où
+# la précision mixte accélère l'entraînement sur CPU
+def _cpu_supports_bf16():
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+# Affiche et enregistre dans l'historique le débit d'entraînement de chaque époque
+# (échantillons/s). Le chronomètre s'arrête au dernier batch d'entraînement : Keras appelle
+# on_epoch_end après la validation, qui ne doit pas compter.
+class ThroughputLogger(Callback):
+    def __init__(self, samples):
+        super().__init__()
+        self.samples = samples
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.start = time.perf_counter()
+        self.end = self.start
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.end = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        samples_per_s = self.samples / max(self.end - self.start, 1e-9)
+        if logs is not None:
+            logs['samples_per_s'] = samples_per_s
+        print(f"Époque {epoch + 1} : {samples_per_s:.1f} échantillons/s")
+
 class CNNModel:
-    def __init__(self, input_shape=(Image_size, Image_size, 3), num_classes=4):
+    # architecture : 'flatten' (Flatten + Dense, taille d'entrée fixe) ou 'gap' (global average
+    # pooling : le nombre de paramètres ne dépend plus de la taille et un seul modèle accepte
+    # toutes les tailles d'entrée). separable remplace les convolutions après la première par
+    # des convolutions séparables en profondeur, moins coûteuses. jit_compile compile le pas
+    # d'entraînement avec XLA.
+    def __init__(self, input_shape=(Image_size, Image_size, 3), num_classes=4, architecture='flatten', separable=False,
+                 jit_compile=False):
+        if architecture not in ('flatten', 'gap'):
+            raise ValueError(f"Architecture inconnue : {architecture}")
         self.input_shape = input_shape
         self.num_classes = num_classes
+        self.architecture = architecture
+        self.separable = separable
+        self.jit_compile = jit_compile
 
     # Architecture CNN simple avec 3 couches convolutives + denses
     def build(self):
+        conv = SeparableConv2D if self.separable else Conv2D
+        if self.architecture == 'gap':
+            input_shape = (None, None, self.input_shape[-1]) # Hauteur et largeur libres
+            head = [GlobalAveragePooling2D()]
+        else:
+            input_shape = self.input_shape
+            head = [Flatten()]
+
         model = Sequential([
-            Conv2D(32, (3, 3), activation='relu', input_shape=self.input_shape),
+            Conv2D(32, (3, 3), activation='relu', input_shape=input_shape),
             MaxPooling2D(2, 2),
 
-            Conv2D(64, (3, 3), activation='relu'),
+            conv(64, (3, 3), activation='relu'),
             MaxPooling2D(2, 2),
 
-            Conv2D(128, (3, 3), activation='relu'),
+            conv(128, (3, 3), activation='relu'),
             MaxPooling2D(2, 2),
 
-            Flatten(),
+            *head,
             Dense(128, activation='relu'),
             Dropout(0.5),
-            Dense(self.num_classes, activation='softmax') # Softmax pour la classification multiclasses
+            # Softmax pour la classification multiclasses, gardé en float32 en précision mixte
+            Dense(self.num_classes, activation='softmax', dtype='float32')
         ])
 
         # Compilation du modèle avec Adam et entropie croisée catégorique
         model.compile(optimizer=Adam(),
                       loss='categorical_crossentropy',
-                      metrics=['accuracy'])
+                      metrics=['accuracy'],
+                      jit_compile=self.jit_compile)
         return model
 
 class CNNTrainer:
@@ -65,31 +180,87 @@ class CNNTrainer:
         self.val_generator = None
         self.test_generator = None
 
-    # Redimensionne toutes les images
-    def resize_folder_images(self, folder_path_input, folder_path_output):
-        
-        os.makedirs(folder_path_output, exist_ok=True)
-
-        for class_dir in os.listdir(folder_path_input):
+        # Session HTTP partagée pour les prédictions sur des URLs
+        self.fetcher = ImageFetcher()
+
+        # Cache des prédictions ; model_key identifie le modèle sauvegardé ou chargé
+        # (None tant que les poids ne correspondent à aucun fichier : pas de cache)
+        self.prediction_cache = PredictionCache()
+        self.model_key = None
+
+        # Modèles déjà chargés (LRU), métadonnées du modèle courant et statistiques
+        # d'entraînement enregistrées avec lui par save_model
+        self.model_registry = ModelRegistry()
+        self.model_metadata = None
+        self.model_path = None
+        self.train_stats = {}
+        self.dtype_policy = None # Politique de précision de build_model (None : celle du processus)
+
+    # Énumère paresseusement les images à redimensionner sous la forme
+    # (source, [(sortie, taille), ...]) pour chaque dossier de sortie demandé
+    def _iter_resize_tasks(self, folder_path_input, outputs, skip_existing, stats):
+        for class_dir in sorted(os.listdir(folder_path_input)):
             class_path = os.path.join(folder_path_input, class_dir)
-            if os.path.isdir(class_path):
-                output_class_dir = os.path.join(folder_path_output, class_dir)
-                os.makedirs(output_class_dir, exist_ok=True)
+            if not os.path.isdir(class_path):
+                continue
+            for folder_path_output, _ in outputs:
+                os.makedirs(os.path.join(folder_path_output, class_dir), exist_ok=True)
+
+            for entry in os.scandir(class_path):
+                if not entry.is_file():
+                    continue
+                output_filename = os.path.splitext(entry.name)[0] + ".jpg"
+                targets = []
+                for folder_path_output, size in outputs:
+                    output_path = os.path.join(folder_path_output, class_dir, output_filename)
+                    if not (skip_existing and is_up_to_date(entry.path, output_path, size)):
+                        targets.append((output_path, size))
+                if not targets:
+                    stats['skipped'] += 1
+                    continue
+                yield entry.path, targets
+
+    # Exécute les tâches de redimensionnement et affiche le débit obtenu
+    def _run_resize(self, folder_path_input, outputs, workers, skip_existing):
+        workers = workers or os.cpu_count() or 1
+
+        stats = {'done': 0, 'skipped': 0, 'errors': 0}
+        start = time.perf_counter()
+        tasks = self._iter_resize_tasks(folder_path_input, outputs, skip_existing, stats)
+        for img_path, error in _run_in_pool(resize_one, tasks, workers):
+            if error is None:
+                stats['done'] += 1
+            else:
+                stats['errors'] += 1
+                print(f"Erreur avec l'image {img_path}: {error}")
+        elapsed = time.perf_counter() - start
+
+        print(f"{stats['done']} images en {elapsed:.1f}s ({stats['done'] / max(elapsed, 1e-9):.1f} images/s), "
+              f"{stats['skipped']} déjà à jour, {stats['errors']} erreurs")
+
+    # Redimensionne toutes les images. Le travail est réparti image par image sur
+    # `workers` processus (tous les cœurs par défaut, 1 = exécution séquentielle) ;
+    # les sorties déjà à jour sont ignorées si skip_existing est vrai.
+    def resize_folder_images(self, folder_path_input, folder_path_output, workers=None, skip_existing=True):
 
-                for filename in os.listdir(class_path):
-                    img_path = os.path.join(class_path, filename)
-                    try:
-                        with Image.open(img_path) as img:
-                            img = img.resize((self.IMG_HEIGHT, self.IMG_WIDTH)).convert('RGB')
-                            output_filename = os.path.splitext(filename)[0] + ".jpg"
-                            img.save(os.path.join(output_class_dir, output_filename), format="JPEG")
-                    except Exception as e:
-                        print(f"Erreur avec l'image {img_path}: {e}")
+        os.makedirs(folder_path_output, exist_ok=True)
+        size = (self.IMG_HEIGHT, self.IMG_WIDTH)
+        self._run_resize(folder_path_input, [(folder_path_output, size)], workers, skip_existing)
         print("Redimensionnement terminée dans :", folder_path_output)
 
-    # Augmente chaque image du dossier source en générant des variantes transformées
-    def augment_data_and_save(self, source_dir, target_dir, augmentations_per_image=2, color=True):
-        datagen = ImageDataGenerator(
+    # Redimensionne toutes les images à plusieurs tailles en ne décodant chaque source
+    # qu'une fois. output_pattern contient {size}, par ex. 'Images_resized_{size}x{size}'.
+    def resize_folder_images_multi(self, folder_path_input, output_pattern, sizes=(32, 64, 128, 256),
+                                   workers=None, skip_existing=True):
+        outputs = [(output_pattern.format(size=n), (n, n)) for n in sizes]
+        for folder_path_output, _ in outputs:
+            os.makedirs(folder_path_output, exist_ok=True)
+        self._run_resize(folder_path_input, outputs, workers, skip_existing)
+        print("Redimensionnement terminée dans :", ", ".join(path for path, _ in outputs))
+
+    # Transformations aléatoires de l'augmentation hors ligne
+    def _augmentation_generator(self):
+        return ImageDataGenerator(
             rotation_range=30,
             width_shift_range=0.2,
             height_shift_range=0.2,
@@ -99,6 +270,10 @@ class CNNTrainer:
             fill_mode='nearest'
         )
 
+    # Augmente chaque image du dossier source en générant des variantes transformées
+    def augment_data_and_save(self, source_dir, target_dir, augmentations_per_image=2, color=True):
+        datagen = self._augmentation_generator()
+
         os.makedirs(target_dir, exist_ok=True)
 
         for class_name in tqdm(os.listdir(source_dir)):
@@ -121,9 +296,10 @@ class CNNTrainer:
                     x = np.expand_dims(x, axis=0)
 
                     i = 0
+                    # Le nom de l'image d'origine est gardé pour pouvoir regrouper ses variantes au split
                     for batch in datagen.flow(x, batch_size=1,
                                               save_to_dir=target_class_dir,
-                                              save_prefix="aug",
+                                              save_prefix=os.path.splitext(filename)[0] + "_aug",
                                               save_format="jpeg"):
                         i += 1
                         if i >= augmentations_per_image:
@@ -156,58 +332,384 @@ class CNNTrainer:
 
         print("Séparation terminée dans :", output_base_dir)
 
-    # Crée les générateurs Keras pour charger les données depuis les répertoires train/val/test.
-    def prepare_generators(self, base_dir):
-        datagen = ImageDataGenerator(rescale=1./self.PIXELS)
+    # Split reproductible sans copie : chaque image est placée selon l'empreinte de
+    # 'classe/image d'origine' (_stable_split), donc ajouter des images ne déplace jamais les
+    # autres et les variantes augmentées d'une image restent dans le même split.
+    # max_distance regroupe en plus les quasi-doublons (dHash, voir dedup.py), au prix d'une
+    # lecture de toutes les images.
+    # mode 'index' écrit seulement train.txt, val.txt et test.txt dans output_base_dir (lus par
+    # prepare_datasets et pack_dataset) ; 'hardlink', 'symlink' et 'copy' recréent les dossiers
+    # train/val/test habituels, utilisables aussi par prepare_generators.
+    def split_dataset_by_hash(self, source_dir, output_base_dir, train_ratio=0.7, val_ratio=0.15, test_ratio=0.15,
+                              mode='index', max_distance=None):
+        assert abs(train_ratio + val_ratio + test_ratio - 1.0) < 1e-6, "Les ratios doivent faire 1"
+        if mode not in SPLIT_MODES:
+            raise ValueError(f"Mode de split inconnu : {mode}")
+        ratios = [train_ratio, val_ratio, test_ratio]
 
-        self.train_generator = datagen.flow_from_directory(
-            os.path.join(base_dir, 'train'),
-            target_size=(self.IMG_HEIGHT, self.IMG_WIDTH),
-            batch_size=self.BATCH_SIZE,
-            class_mode='categorical'
-        )
+        samples, keys = [], []
+        for class_name in sorted(os.listdir(source_dir)):
+            class_path = os.path.join(source_dir, class_name)
+            if not os.path.isdir(class_path):
+                continue
+            for entry in sorted(os.scandir(class_path), key=lambda e: e.name):
+                if entry.is_file():
+                    samples.append((entry.path, class_name))
+                    keys.append(f"{class_name}/{origin_name(entry.name)}")
+        if max_distance is not None: # Tout le groupe prend la clé de son représentant
+            roots, _ = group_images([path for path, _ in samples], max_distance=max_distance)
+            keys = [keys[root] for root in roots]
+
+        splits = {'train': [], 'val': [], 'test': []}
+        for sample, key in zip(samples, keys):
+            splits[_stable_split(key, ratios)].append(sample)
+
+        os.makedirs(output_base_dir, exist_ok=True)
+        for split_name, samples in splits.items():
+            index_path = os.path.join(output_base_dir, split_name + INDEX_SUFFIX)
+            split_dir = os.path.join(output_base_dir, split_name)
+            if mode == 'index':
+                write_index(index_path, samples)
+                continue
 
-        self.val_generator = datagen.flow_from_directory(
-            os.path.join(base_dir, 'val'),
-            target_size=(self.IMG_HEIGHT, self.IMG_WIDTH),
-            batch_size=self.BATCH_SIZE,
-            class_mode='categorical'
-        )
+            # Dossiers reconstruits à chaque fois pour ne pas garder d'images disparues
+            if os.path.lexists(index_path):
+                os.remove(index_path)
+            shutil.rmtree(split_dir, ignore_errors=True)
+            for img_path, class_name in samples:
+                os.makedirs(os.path.join(split_dir, class_name), exist_ok=True)
+                _link_file(img_path, os.path.join(split_dir, class_name, os.path.basename(img_path)), mode)
+
+        print(f"Séparation ({mode}) terminée dans : {output_base_dir} "
+              f"({', '.join(f'{name} {len(samples)}' for name, samples in splits.items())})")
+
+    # Étape 'resize' de prepare_data : redimensionne les images reçues dans le pool de processus
+    def _resize_items(self, items, output_dir, workers):
+        size = (self.IMG_HEIGHT, self.IMG_WIDTH)
+        rels = {}
+        tasks = []
+        for img_path, rel, _ in items:
+            class_name, filename = rel.split('/', 1)
+            os.makedirs(os.path.join(output_dir, class_name), exist_ok=True)
+            output_rel = f"{class_name}/{os.path.splitext(filename)[0]}.jpg"
+            rels[img_path] = (rel, output_rel)
+            tasks.append((img_path, [(os.path.join(output_dir, output_rel), size)]))
+
+        for img_path, error in _run_in_pool(resize_one, tasks, workers or os.cpu_count() or 1):
+            rel, output_rel = rels[img_path]
+            if error is not None:
+                print(f"Erreur avec l'image {img_path}: {error}")
+                yield rel, None
+            else:
+                yield rel, {'outputs': [output_rel]}
+
+    # Étape 'augment' de prepare_data. Les variantes sont nommées {nom}_aug{k}.jpg et tirées
+    # avec une graine dérivée du contenu de l'image : une image inchangée donne toujours les
+    # mêmes variantes, et une image modifiée remplace exactement les siennes.
+    def _augment_items(self, items, output_dir, augmentations_per_image, color):
+        datagen = self._augmentation_generator()
+        for img_path, rel, _ in tqdm(items):
+            class_name, filename = rel.split('/', 1)
+            os.makedirs(os.path.join(output_dir, class_name), exist_ok=True)
+            try:
+                if color:
+                    img = load_img(img_path, color_mode='rgb')
+                else:
+                    img = Image.open(img_path).convert('L').convert('RGB')
+                x = img_to_array(img)
+                seed = int(file_sha256(img_path)[:8], 16)
+
+                outputs = []
+                for k in range(augmentations_per_image):
+                    output_rel = f"{class_name}/{os.path.splitext(filename)[0]}_aug{k}.jpg"
+                    array_to_img(datagen.random_transform(x, seed=seed + k)).save(
+                        os.path.join(output_dir, output_rel), format="JPEG")
+                    outputs.append(output_rel)
+                yield rel, {'outputs': outputs}
+            except Exception as e:
+                print(f"Erreur avec l'image {img_path}: {e}")
+                yield rel, None
+
+    # Étape 'split' de prepare_data : une image déjà répartie garde son split, une nouvelle
+    # image est placée selon l'empreinte du nom de son image d'origine (stable d'une exécution
+    # à l'autre, et commune à toutes ses variantes augmentées)
+    def _split_items(self, items, output_dir, ratios, mode):
+        for img_path, rel, previous in items:
+            class_name, filename = rel.split('/', 1)
+            split = (previous or {}).get('split') or _stable_split(f"{class_name}/{origin_name(filename)}", ratios)
+            os.makedirs(os.path.join(output_dir, split, class_name), exist_ok=True)
+            output_rel = f"{split}/{rel}"
+            _link_file(img_path, os.path.join(output_dir, output_rel), mode)
+            yield rel, {'split': split, 'outputs': [output_rel]}
+
+    # Redimensionnement, augmentation et split en une fois, de façon incrémentale : chaque
+    # étape ne traite que les images nouvelles ou modifiées depuis la dernière exécution et
+    # supprime les sorties des images disparues (voir incremental.py). Sans changement, les
+    # trois étapes sont ignorées et la commande peut être relancée à chaque fois.
+    # split_mode : 'hardlink', 'symlink' ou 'copy' (voir split_dataset_by_hash).
+    def prepare_data(self, raw_dir, resized_dir, augmented_dir, split_dir, augmentations_per_image=2, color=True,
+                     train_ratio=0.7, val_ratio=0.15, test_ratio=0.15, workers=None, split_mode='hardlink'):
+        assert abs(train_ratio + val_ratio + test_ratio - 1.0) < 1e-6, "Les ratios doivent faire 1"
+        if split_mode not in ('hardlink', 'symlink', 'copy'):
+            raise ValueError(f"Mode de split inconnu : {split_mode}")
+        ratios = [train_ratio, val_ratio, test_ratio]
+
+        run_stage('resize', raw_dir, resized_dir, {'size': [self.IMG_HEIGHT, self.IMG_WIDTH]},
+                  lambda items: self._resize_items(items, resized_dir, workers))
+        run_stage('augment', resized_dir, augmented_dir,
+                  {'augmentations_per_image': augmentations_per_image, 'color': color},
+                  lambda items: self._augment_items(items, augmented_dir, augmentations_per_image, color))
+        run_stage('split', augmented_dir, split_dir, {'ratios': ratios, 'mode': split_mode, 'key': 'origin'},
+                  lambda items: self._split_items(items, split_dir, ratios, split_mode))
 
-        self.test_generator = datagen.flow_from_directory(
-            os.path.join(base_dir, 'test'),
-            target_size=(self.IMG_HEIGHT, self.IMG_WIDTH),
-            batch_size=self.BATCH_SIZE,
-            class_mode='categorical',
-            shuffle=False
-        )
+    # Crée les générateurs Keras pour charger les données depuis les répertoires train/val/test.
+    # Les images passent par preprocessing, comme pour predict_image, predict_batch et
+    # l'interface ; val et test reprennent les classes de train même s'il leur en manque une.
+    def prepare_generators(self, base_dir):
+        target_size = (self.IMG_HEIGHT, self.IMG_WIDTH)
+        scale = 1. / self.PIXELS
+
+        self.train_generator = DirectorySequence(split_source(base_dir, 'train'), target_size,
+                                                 batch_size=self.BATCH_SIZE, scale=scale)
+        class_indices = self.train_generator.class_indices
+
+        self.val_generator = DirectorySequence(split_source(base_dir, 'val'), target_size,
+                                               batch_size=self.BATCH_SIZE, scale=scale,
+                                               class_indices=class_indices)
+
+        self.test_generator = DirectorySequence(split_source(base_dir, 'test'), target_size,
+                                                batch_size=self.BATCH_SIZE, scale=scale,
+                                                class_indices=class_indices, shuffle=False)
+
+    # Construit un pipeline tf.data (image, one-hot) pour un dossier de classes ou un index : décodage
+    # parallèle, cache optionnel (True = RAM, chaîne = fichier), mélange, batch, prefetch.
+    def _make_dataset(self, directory, class_indices, training, cache, shuffle_buffer, augmenter):
+        samples, class_indices = list_class_images(directory, class_indices)
+        if training: # Mélange initial pour que le buffer de shuffle voie toutes les classes
+            samples = [samples[i] for i in np.random.default_rng(42).permutation(len(samples))]
+        paths = [path for path, _ in samples]
+        labels = np.array([label for _, label in samples], dtype=np.int32)
+        num_classes = len(class_indices)
+
+        image_size = (self.IMG_WIDTH, self.IMG_HEIGHT)
+        scale = 1. / self.PIXELS
+
+        # Même prétraitement qu'à la prédiction (PIL libère le GIL : le map reste parallèle)
+        def decode(path, label):
+            img = tf.numpy_function(lambda p: preprocess_image(p.decode(), image_size, scale=scale),
+                                    [path], tf.float32)
+            img.set_shape((self.IMG_HEIGHT, self.IMG_WIDTH, 3))
+            return img, tf.one_hot(label, num_classes)
+
+        ds = tf.data.Dataset.from_tensor_slices((paths, labels))
+        ds = ds.map(decode, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not training)
+        if cache:
+            ds = ds.cache('' if cache is True else cache)
+        if training:
+            ds = ds.shuffle(shuffle_buffer, reshuffle_each_iteration=True)
+        ds = ds.batch(self.BATCH_SIZE)
+        if training and augmenter is not None:
+            def augment(x, y):
+                x_aug = tf.numpy_function(augmenter, [x], tf.float32)
+                x_aug.set_shape(x.shape)
+                return x_aug, y
+            ds = ds.map(augment, num_parallel_calls=tf.data.AUTOTUNE)
+        ds = ds.prefetch(tf.data.AUTOTUNE)
+
+        # Mêmes attributs que les itérateurs de flow_from_directory
+        ds.class_indices = class_indices
+        ds.classes = labels
+        ds.samples = len(labels)
+        return ds
+
+    # Équivalent de prepare_generators basé sur tf.data, pour ne pas affamer le modèle sur
+    # les machines multi-cœurs. cache : None, True (RAM) ou préfixe de fichier de cache.
+    # base_dir peut aussi contenir les index train.txt, val.txt et test.txt de split_dataset_by_hash.
+    def prepare_datasets(self, base_dir, cache=None, shuffle_buffer=1000, augmenter=None):
+        datasets = {}
+        class_indices = None
+        for split in ['train', 'val', 'test']:
+            split_cache = f"{cache}_{split}" if isinstance(cache, str) else cache
+            datasets[split] = self._make_dataset(split_source(base_dir, split), class_indices,
+                                                 split == 'train', split_cache, shuffle_buffer, augmenter)
+            class_indices = datasets[split].class_indices
+
+        self.train_generator = datasets['train']
+        self.val_generator = datasets['val']
+        self.test_generator = datasets['test']
+
+    # Compacte les splits train/val/test (dossiers ou index de split_dataset_by_hash) au format
+    # memmap de packed_dataset. À faire une seule fois par taille d'image.
+    def pack_dataset(self, base_dir, packed_dir):
+        class_indices = None
+        for split in ['train', 'val', 'test']:
+            class_indices = write_packed(split_source(base_dir, split),
+                                         os.path.join(packed_dir, split),
+                                         (self.IMG_HEIGHT, self.IMG_WIDTH),
+                                         class_indices=class_indices)
+        print("Compactage terminé dans :", packed_dir)
+
+    # Équivalent de prepare_generators pour un jeu de données compacté avec pack_dataset.
+    # augmenter (par ex. BatchAugmenter(seed=42)) augmente les batches d'entraînement à la
+    # volée et remplace alors augment_data_and_save.
+    def prepare_packed(self, packed_dir, augmenter=None):
+        self.train_generator = PackedSequence(os.path.join(packed_dir, 'train'),
+                                              batch_size=self.BATCH_SIZE, rescale=1./self.PIXELS,
+                                              augmenter=augmenter)
+        self.val_generator = PackedSequence(os.path.join(packed_dir, 'val'),
+                                            batch_size=self.BATCH_SIZE, rescale=1./self.PIXELS, shuffle=False)
+        self.test_generator = PackedSequence(os.path.join(packed_dir, 'test'),
+                                             batch_size=self.BATCH_SIZE, rescale=1./self.PIXELS, shuffle=False)
+
+    # Mode d'entraînement rapide, à appeler avant build_model (et de préférence avant toute
+    # opération TensorFlow, sans quoi le nombre de threads ne peut plus être changé) :
+    # compilation XLA, taille des pools de threads CPU (intra/inter-op) et précision mixte
+    # bfloat16 ('auto' = seulement si le CPU la supporte nativement). La précision ne vaut que
+    # pour les modèles construits par build_model : la politique globale de Keras n'est pas
+    # modifiée durablement, ni pour les autres modèles, ni pour l'export TFLite.
+    def configure_fast_training(self, jit_compile=True, intra_op_threads=None, inter_op_threads=None,
+                                mixed_precision_mode='auto'):
+        try:
+            if intra_op_threads:
+                tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+            if inter_op_threads:
+                tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+        except RuntimeError as e:
+            print(f"Threads CPU inchangés (TensorFlow déjà initialisé) : {e}")
+
+        if mixed_precision_mode == 'auto':
+            mixed_precision_mode = _cpu_supports_bf16()
+        self.dtype_policy = 'mixed_bfloat16' if mixed_precision_mode else 'float32'
+
+        self.model_builder.jit_compile = jit_compile
+        print(f"Entraînement rapide : XLA={jit_compile}, threads intra={intra_op_threads or 'auto'}, "
+              f"inter={inter_op_threads or 'auto'}, politique={self.dtype_policy}")
 
     # Construit le modèle CNN
     def build_model(self):
         num_classes = len(self.train_generator.class_indices)
         self.model_builder.num_classes = num_classes
         self.model_builder.input_shape = (self.IMG_HEIGHT, self.IMG_WIDTH, 3)
-        self.model = self.model_builder.build()
+        previous_policy = mixed_precision.global_policy()
+        if self.dtype_policy is not None:
+            mixed_precision.set_global_policy(self.dtype_policy)
+        try:
+            self.model = self.model_builder.build()
+        finally:
+            mixed_precision.set_global_policy(previous_policy)
+        self.model_key = None
+        self.model_metadata = None
+        self.model_path = None
+        self.train_stats = {}
 
     # Entraîne le modèle sur les données d'entraînement et le valide à chaque époque.
-    def train(self, epochs=10):
+    # checkpoint_dir : sauvegarde périodique (modèle, état de l'optimiseur, époque) toutes les
+    # checkpoint_freq ('epoch' ou nombre de batches) ; si une sauvegarde existe, l'entraînement
+    # reprend là où il s'était arrêté. Le meilleur modèle (val_loss) est aussi gardé dans
+    # checkpoint_dir/best.keras. early_stopping_patience arrête l'entraînement quand val_loss
+    # stagne et restaure les meilleurs poids ; reduce_lr_patience divise alors le taux
+    # d'apprentissage par deux.
+    def train(self, epochs=10, checkpoint_dir=None, checkpoint_freq='epoch',
+              early_stopping_patience=None, reduce_lr_patience=None):
+        self.model_key = None
+        self.model_path = None
+
+        callbacks = [ThroughputLogger(self.train_generator.samples)]
+        if checkpoint_dir is not None:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+            callbacks.append(BackupAndRestore(os.path.join(checkpoint_dir, 'backup'), save_freq=checkpoint_freq))
+            callbacks.append(ModelCheckpoint(os.path.join(checkpoint_dir, 'best.keras'),
+                                             monitor='val_loss', save_best_only=True))
+        if reduce_lr_patience is not None:
+            callbacks.append(ReduceLROnPlateau(monitor='val_loss', factor=0.5,
+                                               patience=reduce_lr_patience, min_lr=1e-6))
+        if early_stopping_patience is not None:
+            callbacks.append(EarlyStopping(monitor='val_loss', patience=early_stopping_patience,
+                                           restore_best_weights=True))
+
+        start = time.perf_counter()
         history = self.model.fit(
             self.train_generator,
             epochs=epochs,
-            validation_data=self.val_generator
+            validation_data=self.val_generator,
+            callbacks=callbacks
         )
+        self.train_stats.update({key: float(values[-1]) for key, values in history.history.items()})
+        self.train_stats['epochs'] = len(history.epoch)
+        self.train_stats['train_time_s'] = round(time.perf_counter() - start, 1)
         return history
 
     # Évalue les performances du modèle sur les données de test.
     def evaluate(self):
         loss, acc = self.model.evaluate(self.test_generator)
+        self.train_stats.update({'test_loss': float(loss), 'test_accuracy': float(acc)})
         print(f"Test Accuracy: {acc:.2f}")
 
-    # Sauvegarde le modèle entraîné au format Keras
+    # Noms des classes dans l'ordre de sortie du modèle : ceux du modèle chargé ou sauvegardé
+    # en dernier, sinon ceux des données d'entraînement
+    def _class_names(self):
+        if self.model_metadata is not None:
+            return self.model_metadata['class_names']
+        if self.train_generator is not None:
+            return list(self.train_generator.class_indices.keys())
+        raise ValueError("Classes inconnues : charger un modèle ou préparer les données d'abord")
+
+    # Sauvegarde le modèle entraîné au format Keras, avec ses métadonnées (forme d'entrée,
+    # classes, empreinte, statistiques d'entraînement) dans un fichier .json à côté
     def save_model(self, filename='cnn_model.keras'):
         self.model.save(filename)
+        self.model_metadata = write_metadata(filename, (self.IMG_HEIGHT, self.IMG_WIDTH, 3),
+                                             self._class_names(), self.train_stats)
+        self.model_key = read_metadata(filename)['model_key']
+        self.model_path = filename
         print(f"\nModèle enregistré sous {filename}\n")
 
+    # Charge un modèle sauvegardé (gardé en mémoire par le registre pour les chargements
+    # suivants) ; la taille d'entrée et les classes viennent de ses métadonnées. class_names
+    # remplace les classes des métadonnées ; sans métadonnées ni class_names, ce sont celles
+    # des modèles livrés (DEFAULT_CLASS_NAMES).
+    def load_model(self, filename, class_names=None):
+        model, metadata = self.model_registry.get(filename)
+        height, width = metadata['input_shape'][:2]
+
+        class_names = list(class_names or metadata['class_names'] or DEFAULT_CLASS_NAMES)
+        num_outputs = int(np.asarray(model.predict_on_batch(np.zeros((1, height, width, 3), np.float32))).shape[-1])
+        if len(class_names) != num_outputs:
+            raise ValueError(f"{filename} a {num_outputs} sorties mais {len(class_names)} classes "
+                             f"({', '.join(class_names)}) : préciser class_names")
+
+        self.model = model
+        self.model_metadata = dict(metadata, class_names=class_names) # L'entrée du registre reste intacte
+        self.IMG_HEIGHT, self.IMG_WIDTH = height, width
+        self.model_key = self.model_metadata['model_key']
+        self.model_path = filename
+
+    # Exporte le modèle vers TensorFlow Lite (quantization : None, 'dynamic', 'float16' ou
+    # 'int8' avec representative_data), avec ses métadonnées. Le fichier obtenu se charge
+    # avec load_model comme un modèle Keras.
+    def export_tflite(self, filename=None, quantization=None, representative_data=None):
+        filename = filename or f"cnn_model_{self.IMG_HEIGHT}x{self.IMG_WIDTH}_{quantization or 'float32'}.tflite"
+        export_tflite(self.model, filename, quantization, representative_data)
+        write_metadata(filename, (self.IMG_HEIGHT, self.IMG_WIDTH, 3), self._class_names(),
+                       dict(self.train_stats, quantization=quantization))
+        print(f"\nModèle TFLite enregistré sous {filename}\n")
+        return filename
+
+    # Quantifie le modèle (dynamic, float16, int8 calibré sur representative_dir) et affiche
+    # pour chaque variante, la référence float32 et le modèle Keras sauvegardé : taille,
+    # latence sur une image, débit par batch et précision sur test_dir
+    def quantize(self, output_dir=PATH + 'CNN_models', variants=QUANTIZED_VARIANTS,
+                 representative_dir=PATH + 'Images_split/val', test_dir=PATH + 'Images_split/test'):
+        output_stem = os.path.join(output_dir, f"cnn_model_{self.IMG_HEIGHT}x{self.IMG_WIDTH}")
+        paths = quantize_model(self.model, output_stem, (self.IMG_HEIGHT, self.IMG_WIDTH, 3),
+                               self._class_names(), variants, representative_dir, stats=self.train_stats)
+        if self.model_path is not None:
+            paths.insert(0, self.model_path)
+
+        results = benchmark(paths, test_dir, batch_size=self.BATCH_SIZE)
+        print_report(results)
+        return results
+
     # Affiche les courbes d’évolution de la précision et de la perte.
     def plot_training(self, history):
         plt.figure(figsize=(12, 5))
@@ -240,28 +742,52 @@ class CNNTrainer:
 
         print(classification_report(y_true, y_pred, target_names=self.test_generator.class_indices.keys()))
 
-    # Prédit la classe d'une image à partir de son chemin local ou d'une URL.
-    def predict_image(self, image_path_or_url):
-
+    # Lit le contenu brut d'une image à partir de son chemin local ou d'une URL
+    def _read_image_bytes(self, image_path_or_url):
         if image_path_or_url.lower().startswith(('http', 'https')):
-            response = requests.get(image_path_or_url)
-            img = Image.open(BytesIO(response.content))
-        else:
-            img = Image.open(image_path_or_url)
-
-        img_resized = img.resize((self.IMG_HEIGHT, self.IMG_WIDTH)).convert('RGB')
-
-        img_array = img_to_array(img_resized)
-        img_array = np.expand_dims(img_array, axis=0)
-        img_array = img_array / self.PIXELS
-
-        prediction = self.model.predict(img_array)
-
-        predicted_class_index = np.argmax(prediction, axis=1)[0]
-
-        class_names = list(self.train_generator.class_indices.keys())
+            return self.fetcher.fetch(image_path_or_url)
+        with open(image_path_or_url, 'rb') as f:
+            return f.read()
+
+    # Prépare une image pour le modèle : (clé du cache, probabilités en cache ou None,
+    # tableau (H, W, 3) normalisé ou None si la prédiction est déjà en cache).
+    # out : ligne d'un batch préalloué où écrire l'image.
+    def _load_for_prediction(self, image_path_or_url, out=None):
+        data = self._read_image_bytes(image_path_or_url)
+        img_key = image_key(data)
+        if self.model_key is not None:
+            cached = self.prediction_cache.get(self.model_key, img_key)
+            if cached is not None:
+                return img_key, cached, None
+        img = preprocess_image(data, (self.IMG_WIDTH, self.IMG_HEIGHT), out=out, scale=1. / self.PIXELS)
+        return img_key, None, img
+
+    # Prédit la classe d'une image à partir de son chemin local ou d'une URL. Le cache est
+    # consulté avant tout décodage : une image déjà vue n'est décodée que pour l'affichage,
+    # et plus du tout avec show=False.
+    def predict_image(self, image_path_or_url, show=True):
+
+        data = self._read_image_bytes(image_path_or_url)
+        img_key = image_key(data)
+        prediction = None
+        if self.model_key is not None:
+            prediction = self.prediction_cache.get(self.model_key, img_key)
+
+        img_resized = None
+        if prediction is None or show:
+            img_resized = preprocess_image(data, (self.IMG_WIDTH, self.IMG_HEIGHT), scale=1. / self.PIXELS)
+        if prediction is None:
+            prediction = self.model.predict(np.expand_dims(img_resized, axis=0))[0]
+            if self.model_key is not None:
+                self.prediction_cache.put(self.model_key, img_key, prediction)
+
+        predicted_class_index = np.argmax(prediction)
+
+        class_names = self._class_names()
         predicted_class_name = class_names[predicted_class_index]
         print(class_names)
+        if not show:
+            return predicted_class_name
 
         plt.figure(figsize=(6, 6))
         plt.imshow(img_resized)
@@ -271,22 +797,66 @@ class CNNTrainer:
 
         return predicted_class_name
 
+    # Prédit la classe d'un grand nombre d'images (chemins ou URLs) sans affichage.
+    # Les images sont téléchargées et décodées en parallèle par `workers` threads (par défaut
+    # la concurrence du fetcher) et regroupées en batches de batch_size pour une seule passe
+    # du modèle chacun ; le décodage du batch suivant se fait pendant la prédiction du batch
+    # courant. Deux batches float32 préalloués servent en alternance : chaque image est écrite
+    # directement dans sa ligne. Générateur de (source, nom_de_classe, probabilités) ; les
+    # images illisibles sont signalées et ignorées.
+    def predict_batch(self, image_paths_or_urls, batch_size=None, workers=None):
+        batch_size = batch_size or self.BATCH_SIZE
+        workers = workers or self.fetcher.concurrency
+        class_names = self._class_names()
+        sources = iter(image_paths_or_urls)
+        buffers = [BatchBuffer(batch_size, (self.IMG_WIDTH, self.IMG_HEIGHT), scale=1. / self.PIXELS)
+                   for _ in range(2)]
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            def submit_next_batch(buffer):
+                return [(source, executor.submit(self._load_for_prediction, source, buffer.array[i]))
+                        for i, source in enumerate(islice(sources, batch_size))]
+
+            current = 0
+            pending = submit_next_batch(buffers[current])
+            while pending:
+                following = submit_next_batch(buffers[1 - current])
+
+                loaded = []
+                for i, (source, future) in enumerate(pending):
+                    try:
+                        img_key, cached, _ = future.result()
+                        loaded.append((i, source, img_key, cached))
+                    except Exception as e:
+                        print(f"Erreur avec l'image {source}: {e}")
+
+                # Une seule passe du modèle pour les images absentes du cache
+                to_predict = [j for j, (_, _, _, cached) in enumerate(loaded) if cached is None]
+                if to_predict:
+                    batch = buffers[current].rows(loaded[j][0] for j in to_predict)
+                    predictions = np.asarray(self.model.predict_on_batch(batch))
+                    for j, probabilities in zip(to_predict, predictions):
+                        i, source, img_key, _ = loaded[j]
+                        loaded[j] = (i, source, img_key, probabilities)
+                        if self.model_key is not None:
+                            self.prediction_cache.put(self.model_key, img_key, probabilities)
+
+                for _, source, _, probabilities in loaded:
+                    yield source, class_names[int(np.argmax(probabilities))], probabilities
+
+                pending = following
+                current = 1 - current
+
 if __name__ == "__main__":
     # Initialisation du modèle CNN
     cnn_model = CNNModel()
     # Création dy Trainer avec ce modèle
     trainer = CNNTrainer(model=cnn_model)
     
-    # Resize des images (à faire une seule fois). Mettre vos images dans un dossier "Images_Pokemon"
-    trainer.resize_folder_images(PATH + 'Images_Pokemon', PATH + 'Images_resized')
-    
-    
-    # Augmentation (à faire une seule fois)
-    trainer.augment_data_and_save( PATH + 'Images_resized', PATH + 'Images_augmented', augmentations_per_image=2, color=True)
-    
-    
-    # Split (à faire une seule fois)
-    trainer.split_dataset_into_three(PATH + 'Images_augmented', PATH + 'Images_split')
+    # Resize, augmentation et split. Mettre vos images dans un dossier "Images_Pokemon" ;
+    # seules les images ajoutées ou modifiées depuis la dernière exécution sont retraitées
+    trainer.prepare_data(PATH + 'Images_Pokemon', PATH + 'Images_resized', PATH + 'Images_augmented',
+                         PATH + 'Images_split', augmentations_per_image=2, color=True)
     
     # Préparation
     trainer.prepare_generators(PATH + 'Images_split')
@@ -0,0 +1,257 @@
+# Détection des quasi-doublons et des fuites entre splits. Chaque image est résumée par un
+# hachage perceptuel dHash de 64 bits (comparaison des pixels voisins d'une miniature 9x8 en
+# niveaux de gris), calculé en bloc avec NumPy. Deux images sont quasi-doublons si leurs
+# empreintes diffèrent d'au plus max_distance bits. La recherche évite la comparaison de
+# toutes les paires : l'empreinte est découpée en max_distance + 1 bandes et, par le principe
+# des tiroirs, deux empreintes proches ont au moins une bande identique ; seules les images
+# qui partagent une bande sont comparées.
+#
+# Les variantes produites par l'augmentation ({nom}_aug{k}.jpg, ou {nom}_aug_{i}_{n}.jpeg avec
+# augment_data_and_save) sont aussi rattachées à leur image d'origine par leur nom, car une
+# rotation ou un zoom les éloigne trop de l'original pour le hachage.
+#
+#   python dedup.py Images_split --max-distance 4
+import os
+import re
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+from split_index import list_class_images, split_source
+
+HASH_SIZE = 8 # Miniature (HASH_SIZE + 1) x HASH_SIZE : 64 bits
+_AUG_SUFFIX = re.compile(r'_aug(\d+|_\d+_\d+)$')
+
+
+# Nom de l'image d'origine d'une variante augmentée (le nom lui-même sinon), sans extension
+def origin_name(filename):
+    return _AUG_SUFFIX.sub('', os.path.splitext(os.path.basename(filename))[0])
+
+
+# Miniature en niveaux de gris (HASH_SIZE, HASH_SIZE + 1), ou None si l'image est illisible
+def _thumbnail(img_path):
+    try:
+        with Image.open(img_path) as img:
+            img.draft('L', (HASH_SIZE + 1, HASH_SIZE))
+            img = img.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+            return np.asarray(img, dtype=np.int16)
+    except Exception as e:
+        print(f"Erreur avec l'image {img_path}: {e}")
+        return None
+
+
+# dHash de miniatures empilées (N, HASH_SIZE, HASH_SIZE + 1) : un bit par couple de pixels
+# voisins (le pixel de droite est-il plus clair ?), empaqueté en uint64
+def dhash_array(thumbnails):
+    bits = thumbnails[:, :, 1:] > thumbnails[:, :, :-1]
+    packed = np.packbits(bits.reshape(len(bits), -1), axis=1)
+    return packed.view('>u8').ravel().astype(np.uint64)
+
+
+# Empreintes dHash d'une liste de fichiers, décodés par plusieurs threads. Renvoie les
+# empreintes et le masque des images lisibles.
+def dhash_files(paths, workers=8, chunk_size=4096):
+    hashes = np.zeros(len(paths), dtype=np.uint64)
+    valid = np.zeros(len(paths), dtype=bool)
+    with ThreadPoolExecutor(max_workers=workers) as executor, tqdm(total=len(paths)) as progress:
+        for start in range(0, len(paths), chunk_size):
+            thumbnails = list(executor.map(_thumbnail, paths[start:start + chunk_size]))
+            ok = np.array([t is not None for t in thumbnails], dtype=bool)
+            if ok.any():
+                idx = start + np.flatnonzero(ok)
+                hashes[idx] = dhash_array(np.stack([t for t in thumbnails if t is not None]))
+                valid[idx] = True
+            progress.update(len(thumbnails))
+    return hashes, valid
+
+
+# Nombre de bits à 1 de chaque élément d'un tableau uint64
+def _popcount(x):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x)
+    table = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    return table[x.view(np.uint8).reshape(len(x), 8)].sum(axis=1)
+
+
+# Paires (a, b), a < b, d'empreintes distinctes (indices dans unique, trié) à distance de
+# Hamming <= max_distance, trouvées par bandes
+def _close_hash_pairs(unique, max_distance):
+    num_bands = max_distance + 1
+    bounds = np.linspace(0, 64, num_bands + 1).astype(int)
+    candidates = set()
+    for low, high in zip(bounds[:-1], bounds[1:]):
+        band = (unique >> np.uint64(low)) & np.uint64((1 << (high - low)) - 1)
+        order = np.argsort(band, kind='stable')
+        sorted_band = band[order]
+        # Compare chaque empreinte aux suivantes de même bande, décalage par décalage
+        offset = 1
+        while offset < len(order):
+            match = np.flatnonzero(sorted_band[offset:] == sorted_band[:-offset])
+            if len(match) == 0:
+                break
+            a, b = order[match], order[match + offset]
+            close = _popcount(unique[a] ^ unique[b]) <= max_distance
+            candidates.update(zip(np.minimum(a, b)[close].tolist(), np.maximum(a, b)[close].tolist()))
+            offset += 1
+    return np.array(sorted(candidates), dtype=np.int64).reshape(-1, 2)
+
+
+# Liens (i, j), i < j, entre images dont les empreintes sont à distance de Hamming
+# <= max_distance. Ce ne sont pas toutes les paires : les doublons exacts ne sont reliés
+# qu'à leur première occurrence, et deux groupes de doublons proches par une seule paire.
+# Les liens relient exactement les mêmes groupes que la liste complète (voir count_pairs
+# pour le nombre réel de paires), sans sa taille quadratique.
+def near_duplicate_pairs(hashes, max_distance=4):
+    unique, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+
+    # Doublons exacts : chaque image est reliée à la première de même empreinte
+    same = np.flatnonzero(first[inverse] != np.arange(len(hashes)))
+    pairs = [np.stack([first[inverse[same]], same], axis=1)]
+
+    close = _close_hash_pairs(unique, max_distance)
+    pairs.append(np.stack([first[close[:, 0]], first[close[:, 1]]], axis=1))
+    pairs = np.concatenate(pairs).astype(np.int64)
+    return np.sort(pairs, axis=1)
+
+
+# Nombre de paires (i, j), i < j, d'images à distance de Hamming <= max_distance, réparti par
+# couple d'étiquettes : {(étiquette_i, étiquette_j): nombre}, étiquettes dans l'ordre trié.
+# Calculé par empreinte distincte, sans énumérer les paires.
+def count_pairs(hashes, labels, max_distance=4):
+    names, codes = np.unique(np.asarray(labels), return_inverse=True)
+    unique, inverse = np.unique(hashes, return_inverse=True)
+    # Nombre d'images de chaque étiquette pour chaque empreinte distincte
+    counts = np.zeros((len(unique), len(names)), dtype=np.int64)
+    np.add.at(counts, (inverse.ravel(), codes.ravel()), 1)
+
+    # Paires d'images de même empreinte : counts[h, s] * counts[h, t], ou C(counts[h, s], 2)
+    same = counts.T @ counts
+    same[np.diag_indices(len(names))] = (counts * (counts - 1) // 2).sum(axis=0)
+    # Paires entre empreintes distinctes proches : between[s, t] compte (s d'un côté, t de l'autre)
+    close = _close_hash_pairs(unique, max_distance)
+    between = counts[close[:, 0]].T @ counts[close[:, 1]]
+    matrix = same + between + between.T - np.diag(np.diag(between))
+
+    result = {}
+    for i in range(len(names)):
+        for j in range(i, len(names)):
+            if matrix[i, j]:
+                result[(names[i].item(), names[j].item())] = int(matrix[i, j])
+    return result
+
+
+class UnionFind:
+    def __init__(self, size):
+        self.parent = np.arange(size)
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root: # Compression du chemin
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, i, j):
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i != root_j:
+            self.parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    # Représentant du groupe de chaque élément
+    def roots(self):
+        return np.array([self.find(i) for i in range(len(self.parent))])
+
+
+# Regroupe des images (chemins 'classe/fichier' ou absolus) : même classe et même image
+# d'origine, ou quasi-doublons. hashes / valid : empreintes déjà calculées (dhash_files) et
+# masque des images lisibles. Renvoie pour chaque image l'indice du représentant de son
+# groupe, et les liens de quasi-doublons utilisés (voir near_duplicate_pairs).
+def group_images(paths, hashes=None, max_distance=4, workers=8, valid=None):
+    groups = UnionFind(len(paths))
+    by_origin = {}
+    for i, path in enumerate(paths):
+        key = (os.path.basename(os.path.dirname(path)), origin_name(path))
+        groups.union(by_origin.setdefault(key, i), i)
+
+    pairs = np.zeros((0, 2), dtype=np.int64)
+    if max_distance is not None:
+        if hashes is None:
+            hashes, valid = dhash_files(paths, workers)
+        index = np.arange(len(paths)) if valid is None else np.flatnonzero(valid)
+        pairs = index[near_duplicate_pairs(hashes[index], max_distance)]
+        for i, j in pairs.tolist():
+            groups.union(i, j)
+    return groups.roots(), pairs
+
+
+# Cherche les fuites entre les splits train/val/test de base_dir (dossiers ou index) :
+# quasi-doublons ou variantes d'une même image d'origine présents dans deux splits.
+def leakage_report(base_dir, max_distance=4, workers=8):
+    paths, splits = [], []
+    for split in ['train', 'val', 'test']:
+        samples, _ = list_class_images(split_source(base_dir, split))
+        paths += [path for path, _ in samples]
+        splits += [split] * len(samples)
+    splits = np.array(splits)
+
+    hashes, valid = dhash_files(paths, workers)
+    roots, _ = group_images(paths, hashes, max_distance, workers, valid)
+    pair_counts = count_pairs(hashes[valid], splits[valid], max_distance)
+
+    # Groupes présents dans plusieurs splits
+    leaking = {}
+    order = np.argsort(roots, kind='stable')
+    boundaries = np.flatnonzero(np.diff(roots[order])) + 1
+    for members in np.split(order, boundaries):
+        if len(set(splits[members])) > 1:
+            leaking[int(roots[members[0]])] = members
+
+    counts = {}
+    for (split_a, split_b), count in pair_counts.items():
+        if split_a != split_b:
+            counts['/'.join(sorted((split_a, split_b), key=['train', 'val', 'test'].index))] = count
+
+    leaked = set()
+    for members in leaking.values():
+        member_splits = set(splits[members])
+        if 'train' in member_splits:
+            leaked.update(int(m) for m in members if splits[m] != 'train')
+
+    return {
+        'images': len(paths),
+        'groups': int(len(np.unique(roots))),
+        'near_duplicate_pairs': sum(pair_counts.values()),
+        'cross_split_pairs': counts,
+        'leaking_groups': len(leaking),
+        'leaked_images': {split: int(sum(splits[i] == split for i in leaked)) for split in ['val', 'test']},
+        'examples': [[paths[m] for m in members] for members in list(leaking.values())[:20]],
+    }
+
+
+def print_leakage(report):
+    print(f"{report['images']} images, {report['groups']} groupes, {report['near_duplicate_pairs']} paires de quasi-doublons")
+    for key, count in sorted(report['cross_split_pairs'].items()):
+        print(f"  {key} : {count} paires")
+    print(f"{report['leaking_groups']} groupes répartis sur plusieurs splits ; images de val / test "
+          f"ayant un double dans train : {report['leaked_images']['val']} / {report['leaked_images']['test']}")
+    for members in report['examples']:
+        print("  " + ", ".join(members))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quasi-doublons et fuites entre train, val et test")
+    parser.add_argument('base_dir', nargs='?', default='./Images_split', help="Dossier des splits (dossiers ou index)")
+    parser.add_argument('--max-distance', type=int, default=4, help="Distance de Hamming maximale entre dHash")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--json', help="Écrit aussi le rapport dans ce fichier")
+    args = parser.parse_args()
+
+    report = leakage_report(args.base_dir, args.max_distance, args.workers)
+    print_leakage(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,108 @@
+# Récupération d'images distantes pour la prédiction : une session HTTP partagée avec
+# pool de connexions (keep-alive), délais d'attente, nouvelles tentatives avec backoff et
+# taille maximale de réponse. Les téléchargements concurrents se font dans les pools de
+# threads des appelants (CNNTrainer.predict_batch, serve.py), qui partagent la session.
+#
+# Vérification contre un serveur HTTP local (délai, 404, nouvelles tentatives, max_bytes) :
+#   python fetch.py
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class ImageFetcher:
+    def __init__(self, concurrency=8, timeout=(3.05, 10), retries=3, backoff_factor=0.3,
+                 max_bytes=20 * 1024 * 1024, session=None):
+        self.concurrency = concurrency
+        self.timeout = timeout # (connexion, lecture) en secondes
+        self.max_bytes = max_bytes
+
+        self.session = session or requests.Session()
+        retry = Retry(total=retries, backoff_factor=backoff_factor,
+                      status_forcelist=(429, 500, 502, 503, 504), allowed_methods=frozenset(['GET']))
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    # Télécharge le contenu d'une URL en refusant les réponses de plus de max_bytes
+    def fetch(self, url):
+        with self.session.get(url, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            length = response.headers.get('Content-Length')
+            if length is not None and int(length) > self.max_bytes:
+                raise ValueError(f"Image trop volumineuse ({length} octets > {self.max_bytes})")
+
+            chunks = []
+            total = 0
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                total += len(chunk)
+                if total > self.max_bytes:
+                    raise ValueError(f"Image trop volumineuse (> {self.max_bytes} octets)")
+                chunks.append(chunk)
+        return b''.join(chunks)
+
+    def close(self):
+        self.session.close()
+
+
+# Serveur local de substitution : /ok renvoie 1 Ko, /slow attend avant de répondre, /flaky
+# échoue (503) deux fois avant de réussir, /big envoie 2 Ko sans Content-Length, /missing 404
+class _StandInHandler(BaseHTTPRequestHandler):
+    hits = {}
+
+    def do_GET(self):
+        self.hits[self.path] = self.hits.get(self.path, 0) + 1
+        if self.path == '/slow':
+            time.sleep(1)
+        if self.path == '/missing' or (self.path == '/flaky' and self.hits[self.path] <= 2):
+            self.send_error(404 if self.path == '/missing' else 503)
+            return
+        body = b'x' * (2048 if self.path == '/big' else 1024)
+        self.send_response(200)
+        if self.path != '/big':
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError): # Client parti après son délai (/slow)
+            pass
+        self.close_connection = self.path == '/big'
+
+    def log_message(self, *args):
+        pass
+
+
+def check_against_local_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    fetcher = ImageFetcher(timeout=(1, 0.3), retries=2, backoff_factor=0, max_bytes=1500)
+
+    def expect_error(url, error):
+        try:
+            fetcher.fetch(base + url)
+        except error:
+            return
+        raise AssertionError(f"{url} : {error.__name__} attendue")
+
+    try:
+        assert len(fetcher.fetch(base + '/ok')) == 1024
+        assert len(fetcher.fetch(base + '/flaky')) == 1024 and _StandInHandler.hits['/flaky'] == 3
+        expect_error('/missing', requests.HTTPError)
+        assert _StandInHandler.hits['/missing'] == 1 # Pas de nouvelle tentative sur un 404
+        expect_error('/slow', requests.ConnectionError) # Délai de lecture, après les nouvelles tentatives
+        expect_error('/big', ValueError) # max_bytes sans Content-Length
+        fetcher.max_bytes = 1000
+        expect_error('/ok', ValueError) # max_bytes d'après Content-Length
+    finally:
+        fetcher.close()
+        server.shutdown()
+    print("ImageFetcher : délai, 404, nouvelles tentatives et max_bytes vérifiés")
+
+
+if __name__ == "__main__":
+    check_against_local_server()
@@ -0,0 +1,182 @@
+# Chargement d'images à la taille du modèle, partagé par le redimensionnement, l'entraînement,
+# la prédiction, le service HTTP et l'interface. Au lieu de décoder l'image en pleine
+# résolution puis de la réduire :
+#   - draft() laisse le décodeur JPEG réduire l'image (échelle DCT 1/2, 1/4, 1/8) juste
+#     au-dessus de la taille demandée ;
+#   - reducing_gap fait passer le reste de la réduction par Image.reduce (moyenne par blocs,
+#     très rapide) avant le filtre de resize, aussi pour les PNG ;
+#   - l'image est convertie en RGB avant le resize (une image en palette serait sinon
+#     redimensionnée au plus proche voisin).
+# Le backend 'cv2' (OpenCV, optionnel) fait de même avec IMREAD_REDUCED_COLOR_* et
+# INTER_AREA et écrit directement dans le tableau de sortie fourni. pillow-simd, s'il est
+# installé à la place de Pillow, accélère le backend 'pil' sans autre changement.
+# Les deux backends donnent des pixels légèrement différents : garder le même pour
+# l'entraînement et la prédiction.
+#
+# Micro-benchmark (images/s par taille cible et par méthode) :
+#   python image_loading.py Images_test --sizes 32 64 128 256
+import os
+import time
+import argparse
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+BACKENDS = ('pil', 'cv2')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp', '.ppm', '.tif', '.tiff')
+
+
+def available_backends():
+    return [backend for backend in BACKENDS if backend != 'cv2' or cv2 is not None]
+
+
+# Chemin, objet fichier ou octets -> ce qu'accepte Image.open
+def _as_file(source):
+    return BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source
+
+
+# Ouvre une image en RGB, décodée à l'échelle réduite la plus petite qui reste au moins
+# aussi grande que size (largeur, hauteur). À redimensionner ensuite avec reducing_gap.
+def open_reduced(source, size):
+    with Image.open(_as_file(source)) as img:
+        img.draft('RGB', tuple(size))
+        return img.convert('RGB')
+
+
+# Image RGB uint8 (hauteur, largeur, 3) à la taille size = (largeur, hauteur), l'ordre de PIL.
+# out : tableau uint8 de cette forme à réutiliser (par ex. une ligne d'un batch) ; la
+# fonction y écrit le résultat et le renvoie. Lève OSError si l'image est illisible.
+def load_image(source, size, out=None, backend='pil'):
+    size = tuple(size)
+    if backend == 'cv2':
+        return _load_cv2(source, size, out)
+    if backend != 'pil':
+        raise ValueError(f"Backend inconnu : {backend}")
+
+    img = open_reduced(source, size).resize(size, reducing_gap=2.0)
+    if out is None:
+        return np.asarray(img)
+    np.copyto(out, np.asarray(img))
+    return out
+
+
+# Décode une image une seule fois, à l'échelle réduite adaptée à la plus grande taille,
+# et l'enregistre en JPEG à chacune des tailles demandées. task = (chemin, [(sortie, taille)]).
+# Tâche des pools de processus de CNNTrainer : elle vit ici, hors du module qui importe
+# TensorFlow, pour que les workers lancés par spawn ou forkserver ne le réimportent pas.
+# Renvoie un message d'erreur au lieu de lever.
+def resize_one(task):
+    img_path, targets = task
+    try:
+        largest = max(targets, key=lambda t: t[1][0] * t[1][1])[1]
+        img = open_reduced(img_path, largest)
+        for output_path, size in targets:
+            img.resize(size, reducing_gap=2.0).save(output_path, format="JPEG")
+        return img_path, None
+    except Exception as e:
+        return img_path, str(e)
+
+
+# Vrai si la sortie existe, est plus récente que la source et a déjà la bonne taille
+def is_up_to_date(img_path, output_path, size):
+    try:
+        if os.path.getmtime(output_path) < os.path.getmtime(img_path):
+            return False
+        with Image.open(output_path) as out: # Seul l'en-tête est lu
+            return out.size == tuple(size)
+    except (OSError, ValueError):
+        return False
+
+
+# Facteurs de réduction au décodage d'OpenCV, du plus fort au plus faible
+_CV2_REDUCED = ((8, 'IMREAD_REDUCED_COLOR_8'), (4, 'IMREAD_REDUCED_COLOR_4'), (2, 'IMREAD_REDUCED_COLOR_2'))
+
+
+def _load_cv2(source, size, out):
+    if cv2 is None:
+        raise ValueError("Le backend 'cv2' demande OpenCV (pip install opencv-python-headless)")
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = np.frombuffer(source, dtype=np.uint8)
+    elif hasattr(source, 'read'):
+        data = np.frombuffer(source.read(), dtype=np.uint8)
+    else:
+        data = np.fromfile(source, dtype=np.uint8)
+
+    # L'en-tête (lu par PIL sans décoder) donne la taille d'origine, pour choisir la réduction
+    width, height = size
+    flag = cv2.IMREAD_COLOR
+    with Image.open(BytesIO(data)) as header:
+        if header.format == 'JPEG':
+            for factor, name in _CV2_REDUCED:
+                if header.width // factor >= width and header.height // factor >= height:
+                    flag = getattr(cv2, name)
+                    break
+
+    img = cv2.imdecode(data, flag)
+    if img is None:
+        raise OSError("Image illisible par OpenCV")
+    img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    if out is None:
+        out = np.empty((height, width, 3), dtype=np.uint8)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=out)
+
+
+# Ancienne méthode, pour comparaison : décodage complet, resize puis conversion
+def _load_naive(source, size, out=None, backend=None):
+    with Image.open(_as_file(source)) as img:
+        return np.asarray(img.resize(tuple(size)).convert('RGB'))
+
+
+# Images/s de chaque méthode pour chaque taille, sur des images déjà lues en mémoire
+# (seuls le décodage et le redimensionnement sont mesurés)
+def benchmark(image_dir, sizes=(32, 64, 128, 256), max_images=200, repeat=3):
+    paths = sorted(os.path.join(root, f) for root, _, files in os.walk(image_dir) for f in files)[:max_images]
+    images = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            images.append(f.read())
+    if not images:
+        raise ValueError(f"Aucune image dans {image_dir}")
+
+    methods = {'pil (ancien)': (_load_naive, None)}
+    methods.update({backend: (load_image, backend) for backend in available_backends()})
+
+    results = {}
+    for name, (fn, backend) in methods.items():
+        for n in sizes:
+            out = np.empty((n, n, 3), dtype=np.uint8) # Même tampon pour toutes les images
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                for data in images:
+                    fn(data, (n, n), out=out, backend=backend)
+                best = min(best, time.perf_counter() - start)
+            results[(name, n)] = len(images) / best
+    return results, len(images)
+
+
+def print_benchmark(results, sizes):
+    header = f"{'Méthode':<14}" + "".join(f"{f'{n}x{n}':>10}" for n in sizes)
+    print(header)
+    print('-' * len(header))
+    for name in dict.fromkeys(name for name, _ in results):
+        print(f"{name:<14}" + "".join(f"{results[(name, n)]:>10.0f}" for n in sizes))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark du chargement d'images (images/s)")
+    parser.add_argument('image_dir', nargs='?', default='./Images_test')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[32, 64, 128, 256])
+    parser.add_argument('--max-images', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    results, count = benchmark(args.image_dir, args.sizes, args.max_images, args.repeat)
+    print(f"{count} images, Pillow {Image.__version__}, OpenCV {cv2.__version__ if cv2 else 'absent'}")
+    print_benchmark(results, args.sizes)
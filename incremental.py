@@ -0,0 +1,116 @@
+# Préparation incrémentale des données. Chaque étape (redimensionnement, augmentation, split)
+# garde un manifeste (.manifest.json dans son dossier de sortie) : ses paramètres et, pour
+# chaque image d'entrée, sa taille, sa date de modification, son empreinte SHA-256 et les
+# fichiers produits. Une nouvelle exécution ne traite que les images nouvelles ou modifiées,
+# supprime les sorties des images disparues, et ne fait rien du tout si l'étape est à jour.
+# Changer un paramètre de l'étape invalide toutes ses sorties. Une image en échec reste dans
+# le manifeste, sans sortie, et n'est retentée que si elle change.
+import os
+import json
+
+from prediction_cache import file_sha256
+from image_loading import IMAGE_EXTENSIONS
+
+MANIFEST_FILE = '.manifest.json'
+
+
+# Liste les images d'un dossier de classes sous la forme {'classe/fichier': chemin}, d'après
+# leur extension (pas de .DS_Store ni de notes.txt)
+def list_inputs(input_dir):
+    inputs = {}
+    for class_name in sorted(os.listdir(input_dir)):
+        class_path = os.path.join(input_dir, class_name)
+        if not os.path.isdir(class_path):
+            continue
+        for entry in os.scandir(class_path):
+            if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                inputs[f"{class_name}/{entry.name}"] = entry.path
+    return inputs
+
+
+class StageManifest:
+    def __init__(self, output_dir, stage, params):
+        self.path = os.path.join(output_dir, MANIFEST_FILE)
+        self.stage = stage
+        self.params = params
+        self.entries = {}
+        self.params_changed = True
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get('stage') == stage:
+                self.entries = data['entries']
+                self.params_changed = data['params'] != params
+
+    # Vrai si l'image n'a pas changé depuis son dernier traitement. La taille et la date
+    # suffisent dans le cas courant ; sinon l'empreinte tranche (fichier simplement touché).
+    def is_unchanged(self, rel, path):
+        entry = self.entries.get(rel)
+        st = os.stat(path)
+        if entry is None:
+            return False
+        if entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+            return True
+        if entry['size'] == st.st_size and entry['sha256'] == file_sha256(path):
+            entry['mtime_ns'] = st.st_mtime_ns
+            return True
+        return False
+
+    def record(self, rel, path, record):
+        st = os.stat(path)
+        self.entries[rel] = dict(record, size=st.st_size, mtime_ns=st.st_mtime_ns, sha256=file_sha256(path))
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'stage': self.stage, 'params': self.params, 'entries': self.entries}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+def _remove_outputs(output_dir, entry):
+    for rel in entry.get('outputs', []):
+        try:
+            os.remove(os.path.join(output_dir, rel))
+        except FileNotFoundError:
+            pass
+
+
+# Exécute une étape de façon incrémentale. process(items) reçoit la liste des images à
+# (re)traiter sous la forme (chemin, 'classe/fichier', entrée précédente du manifeste ou None)
+# et produit des (rel, enregistrement) où l'enregistrement contient au moins 'outputs'
+# (chemins relatifs à output_dir), ou None si l'image a échoué. Renvoie le nombre d'images traitées.
+def run_stage(stage, input_dir, output_dir, params, process):
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = StageManifest(output_dir, stage, params)
+    if manifest.params_changed:
+        for entry in manifest.entries.values():
+            _remove_outputs(output_dir, entry)
+        manifest.entries = {}
+
+    inputs = list_inputs(input_dir)
+    removed = [rel for rel in manifest.entries if rel not in inputs]
+    todo = [(path, rel, manifest.entries.get(rel)) for rel, path in inputs.items()
+            if not manifest.is_unchanged(rel, path)]
+
+    if not removed and not todo and not manifest.params_changed:
+        print(f"Étape {stage} à jour ({len(inputs)} images), ignorée")
+        return 0
+
+    for rel in removed:
+        _remove_outputs(output_dir, manifest.entries.pop(rel))
+    for _, rel, previous in todo:
+        if previous is not None:
+            _remove_outputs(output_dir, previous)
+
+    done = failed = 0
+    for rel, record in process(todo):
+        if record is None:
+            manifest.record(rel, inputs[rel], {'outputs': [], 'failed': True})
+            failed += 1
+            continue
+        manifest.record(rel, inputs[rel], record)
+        done += 1
+    manifest.save()
+    print(f"Étape {stage} : {done} images traitées, {len(removed)} supprimées, "
+          f"{len(inputs) - len(todo)} inchangées, {failed} en échec")
+    return done
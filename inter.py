@@ -1,6 +1,8 @@
+import time
+START_TIME = time.perf_counter() # Reference for the time-to-first-paint measurement
+
 import sys
-import os
-import re
+import threading
 
 #pip install PyQt5
 from PyQt5.QtWidgets import (
@@ -12,13 +14,54 @@ from PyQt5.QtWidgets import (
     QMessageBox
 )
 from PyQt5.QtMultimedia import QSound
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt, QTimer, QObject, QRunnable, QThreadPool, pyqtSignal
 from PyQt5.QtGui import QPixmap
-from tensorflow import keras
-from PIL import Image
 import numpy as np
 
+from prediction_cache import PredictionCache
+from model_registry import ModelRegistry, DEFAULT_CLASS_NAMES
+from preprocessing import BatchBuffer
+
+
+class WorkerSignals(QObject):
+    finished = pyqtSignal(int, object) # (request id, result)
+    failed = pyqtSignal(int, object)   # (request id, exception)
+
+
+class Worker(QRunnable): # Run fn(*args) on a pool thread and report back to the GUI thread through signals
+    def __init__(self, request_id, fn, *args):
+        super().__init__()
+        self.request_id = request_id
+        self.fn = fn
+        self.args = args
+        self.signals = WorkerSignals()
+
+    def run(self):
+        try:
+            result = self.fn(*self.args)
+        except Exception as e:
+            self.signals.failed.emit(self.request_id, e)
+            return
+        self.signals.finished.emit(self.request_id, result)
+
+
+def importKeras(): # TensorFlow takes seconds to import, so it is only imported when a model is needed
+    from tensorflow import keras
+    return keras
+
+
+def warmUp(): # Runs on a plain thread right after the window is shown
+    start = time.perf_counter()
+    try:
+        importKeras()
+    except Exception as e:
+        print(f"TensorFlow warm-up failed: {e}")
+        return
+    print(f"TensorFlow ready in {time.perf_counter() - start:.3f}s")
+
 
+def loadModel(registry, model_path): # Runs on a worker thread, returns (model, metadata)
+    return registry.get(model_path) # Instant if this model was already loaded
 
 
 class Pokedex(QWidget):
@@ -39,7 +82,22 @@ class Pokedex(QWidget):
         self.images = []
         self.current_index = 0
         self.cnn = None
-        self.pokedex = ["Bulbasaur", "Charmander", "Pikachu","Squirtle"]
+        self.model_key = None # Identity of the loaded model (file hash + input size) for the cache
+        self.predict_buffer = None # Input batch reused between predictions (single predict thread)
+        self.model_registry = ModelRegistry(max_models=4) # The last loaded models stay in memory
+        self.prediction_cache = PredictionCache(path="./CNN_models/prediction_cache.json")
+        self.pokedex = list(DEFAULT_CLASS_NAMES) # Used when a model has no metadata file
+        self.class_names = self.pokedex
+
+        # Model loading and inference run on worker threads so the window never freezes.
+        # A result is only applied if its request id is still the latest one.
+        self.model_pool = QThreadPool(self)
+        self.model_pool.setMaxThreadCount(1)
+        self.predict_pool = QThreadPool(self)
+        self.predict_pool.setMaxThreadCount(1)
+        self.model_request = 0
+        self.predict_request = 0
+        self.first_paint = True
 
         # Style of the directionnal buttons
         arrow_btn_style = """ 
@@ -140,8 +198,21 @@ class Pokedex(QWidget):
         
         
         
+    def paintEvent(self, e): # Report the time to first paint, then warm TensorFlow up in the background
+        super().paintEvent(e)
+        if self.first_paint:
+            self.first_paint = False
+            print(f"Time to first paint: {time.perf_counter() - START_TIME:.3f}s")
+            QTimer.singleShot(0, self.startWarmUp)
+
+    # Not a QRunnable: importing TensorFlow in one pool runnable makes the next model load on
+    # that pool thread crash. A model chosen meanwhile waits on Python's import lock instead.
+    def startWarmUp(self):
+        threading.Thread(target=warmUp, daemon=True).start()
+
     def prevImage(self): # Go back one slot if possible and reload that image
         print(self.current_index, len(self.images))
+        self.cancelPrediction()
         self.predict_label.setText("") # Clear the pokemon prediction label
         if self.current_index != 0:
             self.current_index -= 1
@@ -152,6 +223,7 @@ class Pokedex(QWidget):
     
     def nextImage(self): # Advance to the next slot, clear if it’s a new slot.
         print(self.current_index, len(self.images))
+        self.cancelPrediction()
         self.predict_label.setText("") # Clear the pokemon prediction label
         if self.current_index < len(self.images) :
             self.current_index += 1
@@ -170,65 +242,112 @@ class Pokedex(QWidget):
             self,
             "Select CNN model file",
             "./CNN_models",              
-            "Keras Model (*.h5 *.keras)"
+            "CNN Model (*.h5 *.keras *.tflite)"
         )
         if not model_path:
             return
 
-        try:
-            self.cnn = keras.models.load_model(model_path)
-            self.model_label.setText("Model : ✓")
-
+        self.model_request += 1
+        self.model_label.setText("Model : ...")
+        worker = Worker(self.model_request, loadModel, self.model_registry, model_path)
+        worker.signals.finished.connect(self.onModelLoaded)
+        worker.signals.failed.connect(self.onModelFailed)
+        self.model_pool.start(worker)
 
-            filename = os.path.basename(model_path)   # The name of the cnn "cnn_model_nxn.keras"
-            m = re.search(r'(\d+)x(\d+)', filename) 
-            self.images_size = (int(m.group(1)), int(m.group(2)))
-            print(self.images_size)
-            
-        except Exception as e: # Error box
-            QMessageBox.critical(
-                self,
-                "Error loading the CNN",
-                f"Impossible to load the model :\n{e}"
-            )
+    def onModelLoaded(self, request_id, result):
+        if request_id != self.model_request: # Another model was chosen meanwhile
+            return
+        self.cnn, metadata = result
+        self.images_size = metadata['image_size']
+        self.model_key = metadata['model_key']
+        self.class_names = metadata['class_names'] or self.pokedex # Classes in the order of the model outputs
+        print(self.images_size, self.class_names)
+        self.model_label.setText("Model : ✓")
+
+    def onModelFailed(self, request_id, e):
+        if request_id != self.model_request:
+            return
+        self.model_label.setText("Model : ✓" if self.cnn is not None else "Model : X")
+        QMessageBox.critical( # Error box
+            self,
+            "Error loading the CNN",
+            f"Impossible to load the model :\n{e}"
+        )
 
     def predict(self):
         if self.cnn is None:
             QMessageBox.warning(self, "No model",
                                 "Please choose a CNN model first.")
             return
-        if len(self.images) == 0 and self.current_index == len(self.images):
+        if self.current_index >= len(self.images):
             QMessageBox.warning(self, "No image",
                                 "Please load an image before predicting.")
             return
 
-        try: # Try to open the image, resize and convert in rgb
-            print(self.images[self.current_index])
-            img = Image.open(self.images[self.current_index])
-            img = img.resize(self.images_size)      # size of the images   
-            img = img.convert('RGB')             
-        except Exception as e:
+        path = self.images[self.current_index]
+        print(path)
+        self.cancelPrediction() # A new request replaces any pending one
+        self.setBusy(True)
+        worker = Worker(self.predict_request, self.runPrediction,
+                        path, self.cnn, self.images_size, self.model_key, self.class_names)
+        worker.signals.finished.connect(self.onPredicted)
+        worker.signals.failed.connect(self.onPredictFailed)
+        self.predict_pool.start(worker)
+
+    def runPrediction(self, path, cnn, images_size, model_key, class_names): # Runs on a worker thread
+        img_key = self.prediction_cache.file_key(path)
+        preds = self.prediction_cache.get(model_key, img_key) # Already scored with this model ?
+        if preds is None:
+            # Same preprocessing as training (see preprocessing), written into the reused batch
+            buffer = self.predict_buffer
+            if buffer is None or buffer.image_size != tuple(images_size):
+                buffer = self.predict_buffer = BatchBuffer(1, images_size) # shape (1,H,W,3)
+            buffer.load_into(0, path)
+
+            preds = cnn.predict(buffer.array, verbose=0)[0]
+            self.prediction_cache.put(model_key, img_key, preds)
+        return preds, class_names
+
+    def onPredicted(self, request_id, result):
+        if request_id != self.predict_request: # Stale result, the user moved to another image
+            return
+        self.setBusy(False)
+        preds, class_names = result
+        print(preds)
+        idx   = np.argmax(preds)
+        self.predict_label.setText(class_names[idx])
+
+    def onPredictFailed(self, request_id, e):
+        if request_id != self.predict_request:
+            return
+        self.setBusy(False)
+        if isinstance(e, OSError): # PIL errors on unreadable files are OSError too
             QMessageBox.critical(self, 
                                  "Load error",
                                  f"Cannot open image:\n{e}")
-            return
-
-        # Normalise and reshape it
-        arr = np.asarray(img, dtype=np.float32) / 255.0  
-        batch = np.expand_dims(arr, axis=0)       # shape (1,256,256,3)
-    
-
-        try:
-            preds = self.cnn.predict(batch)
-        except Exception as e:
+        else:
             QMessageBox.critical(self, 
                                  "Prediction error",
                                  f"Prediction failed:\n{e}")
-            return
-            
-        print(preds)
-        idx   = np.argmax(preds[0])
-        self.predict_label.setText(self.pokedex[idx])
+
+    def cancelPrediction(self): # Drop queued predictions and ignore the running one
+        self.predict_request += 1
+        self.predict_pool.clear()
+        self.setBusy(False)
+
+    def setBusy(self, busy): # Busy indicator while a prediction is running
+        if busy:
+            self.predict_label.setText("...")
+            self.setCursor(Qt.BusyCursor)
+        else:
+            if self.predict_label.text() == "...":
+                self.predict_label.setText("")
+            self.unsetCursor()
+
+    def closeEvent(self, e): # Keep the predictions for the next session
+        self.cancelPrediction()
+        self.prediction_cache.save()
+        super().closeEvent(e)
 
     
 
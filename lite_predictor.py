@@ -0,0 +1,291 @@
+# Export des modèles Keras vers TensorFlow Lite et prédicteur léger pour l'inférence.
+# Un modèle .tflite se charge en quelques millisecondes (le fichier est projeté en mémoire),
+# ne nécessite que l'interpréteur TFLite et peut être quantifié (dynamic, float16, int8).
+# LitePredictor expose predict / predict_on_batch comme un keras.Model, si bien que
+# CNNTrainer.predict_image, predict_batch et l'interface Pokedex l'utilisent tels quels.
+#
+# Benchmark Keras / TFLite :
+#   python lite_predictor.py CNN_models/cnn_model_32x32.keras CNN_models/cnn_model_32x32_float16.tflite \
+#       --test-dir Images_split/test
+# Quantification d'un modèle Keras puis comparaison de toutes ses variantes :
+#   python lite_predictor.py CNN_models/cnn_model_256x256.keras --quantize dynamic float16 int8 \
+#       --representative-dir Images_split/val --test-dir Images_split/test
+import os
+import sys
+import time
+import argparse
+import threading
+import multiprocessing
+
+import numpy as np
+
+from preprocessing import preprocess_image
+
+QUANTIZATIONS = (None, 'dynamic', 'float16', 'int8')
+QUANTIZED_VARIANTS = ('dynamic', 'float16', 'int8')
+
+
+# Interpréteur TFLite le plus léger disponible : LiteRT, tflite_runtime, puis TensorFlow
+def _interpreter_class():
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+# Copie float32 (mêmes poids) d'un modèle construit en précision mixte
+# (configure_fast_training) : TFLite ne sait pas convertir les opérations bfloat16
+def _float32_model(model):
+    from tensorflow import keras
+
+    if all(layer.dtype_policy.compute_dtype == 'float32' for layer in model.layers):
+        return model
+    clone = keras.models.clone_model(
+        model, clone_function=lambda layer: layer.__class__.from_config(dict(layer.get_config(), dtype='float32')))
+    clone.set_weights(model.get_weights())
+    return clone
+
+
+# Convertit un modèle Keras en TFLite. quantization : None (float32), 'dynamic' (poids int8),
+# 'float16' ou 'int8' (entiers de bout en bout, representative_data requis : tableau
+# (N, H, W, 3) float32 d'images normalisées comme à l'entraînement)
+def export_tflite(model, output_path, quantization=None, representative_data=None):
+    import tensorflow as tf
+
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Quantification inconnue : {quantization}")
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(_float32_model(model))
+    if quantization is not None:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        if representative_data is None:
+            raise ValueError("La quantification int8 demande des données représentatives")
+        converter.representative_dataset = lambda: ([x[None].astype(np.float32)] for x in representative_data)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+    return output_path
+
+
+# Échantillon d'images normalisées (N, H, W, 3) tirées au hasard d'un dossier de classes
+# (par ex. Images_split/val), pour calibrer la quantification int8
+def representative_images(directory, image_size, num_samples=200, seed=42):
+    paths = sorted(os.path.join(root, filename) for root, _, files in os.walk(directory) for filename in files)
+    rng = np.random.default_rng(seed)
+    paths = [paths[i] for i in rng.permutation(len(paths))[:num_samples]]
+
+    images = []
+    for path in paths:
+        try:
+            images.append(preprocess_image(path, image_size))
+        except OSError as e:
+            print(f"Erreur avec l'image {path}: {e}")
+    if not images:
+        raise ValueError(f"Aucune image représentative dans {directory}")
+    return np.stack(images)
+
+
+# Exporte un modèle Keras en TFLite float32 (référence) et dans chacune des variantes
+# quantifiées demandées, sous {output_stem}_{variante}.tflite avec leurs métadonnées.
+# Renvoie la liste des fichiers écrits.
+def quantize_model(model, output_stem, input_shape, class_names, variants=QUANTIZED_VARIANTS,
+                   representative_dir='./Images_split/val', num_samples=200, stats=None):
+    from model_registry import write_metadata
+
+    representative = None
+    if 'int8' in variants:
+        height, width = input_shape[:2]
+        representative = representative_images(representative_dir, (width, height), num_samples)
+
+    paths = []
+    for quantization in (None,) + tuple(variants):
+        path = f"{output_stem}_{quantization or 'float32'}.tflite"
+        export_tflite(model, path, quantization, representative)
+        write_metadata(path, input_shape, class_names, dict(stats or {}, quantization=quantization))
+        paths.append(path)
+        print(f"Modèle TFLite enregistré sous {path}")
+    return paths
+
+
+# xnnpack=False désactive le délégué XNNPACK par défaut : les opérations sont plus lentes
+# mais lisent les poids directement dans le fichier projeté en mémoire, au lieu d'en garder
+# une copie réarrangée propre au processus (utile quand plusieurs processus servent le modèle)
+class LitePredictor:
+    def __init__(self, model_path, num_threads=None, xnnpack=True):
+        self.model_path = model_path
+        interpreter_class = _interpreter_class()
+        options = {}
+        if not xnnpack:
+            op_resolver_type = sys.modules[interpreter_class.__module__].OpResolverType
+            options['experimental_op_resolver_type'] = op_resolver_type.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+        self.interpreter = interpreter_class(model_path=model_path, num_threads=num_threads, **options)
+        self._input = self.interpreter.get_input_details()[0]
+        if (self._input['shape_signature'] < 0).any():
+            # Entrée de taille libre (modèles 'gap'), exportée en [1, 1, 1, 3] : les convolutions
+            # ne peuvent pas être préparées à cette taille, on part de celle des métadonnées
+            from model_registry import read_metadata
+            height, width = read_metadata(model_path)['input_shape'][:2]
+            self.interpreter.resize_tensor_input(self._input['index'], (1, height, width, 3))
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self.input_shape = tuple(int(n) for n in self._input['shape'][1:])
+        self._batch_shape = tuple(int(n) for n in self._input['shape'])
+        self._lock = threading.Lock() # L'interpréteur n'est pas utilisable par deux threads à la fois
+
+    def _quantize(self, batch):
+        scale, zero_point = self._input['quantization']
+        if not np.issubdtype(self._input['dtype'], np.integer):
+            return batch.astype(self._input['dtype'], copy=False)
+        info = np.iinfo(self._input['dtype'])
+        return np.clip(np.rint(batch / scale + zero_point), info.min, info.max).astype(self._input['dtype'])
+
+    def _dequantize(self, out):
+        scale, zero_point = self._output['quantization']
+        if not np.issubdtype(self._output['dtype'], np.integer):
+            return out.astype(np.float32, copy=False)
+        return (out.astype(np.float32) - zero_point) * scale
+
+    # Probabilités (N, classes) pour un batch (N, H, W, 3) normalisé
+    def predict(self, batch, verbose=0):
+        batch = np.asarray(batch)
+        with self._lock:
+            if batch.shape != self._batch_shape: # Autre taille de batch, ou d'image (modèles 'gap')
+                self.interpreter.resize_tensor_input(self._input['index'], batch.shape)
+                self.interpreter.allocate_tensors()
+                self._batch_shape = batch.shape
+            self.interpreter.set_tensor(self._input['index'], self._quantize(batch))
+            self.interpreter.invoke()
+            return self._dequantize(self.interpreter.get_tensor(self._output['index']))
+
+    predict_on_batch = predict
+
+
+# Charge un modèle Keras ou TFLite selon l'extension du fichier. num_threads et xnnpack ne
+# concernent que l'interpréteur TFLite.
+def load_predictor(model_path, num_threads=None, xnnpack=True):
+    if model_path.endswith('.tflite'):
+        return LitePredictor(model_path, num_threads, xnnpack)
+    from tensorflow import keras
+    return keras.models.load_model(model_path)
+
+
+# Mémoire résidente actuelle du processus, en Mo (/proc sous Linux ; ailleurs le pic,
+# faute de mieux)
+def _rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except OSError:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+# Charge les images d'un dossier de classes en un tableau normalisé et leurs labels
+def _load_labelled_images(test_dir, image_size, class_names):
+    images, labels = [], []
+    for label, class_name in enumerate(class_names):
+        class_path = os.path.join(test_dir, class_name)
+        if not os.path.isdir(class_path):
+            continue
+        for filename in sorted(os.listdir(class_path)):
+            try:
+                images.append(preprocess_image(os.path.join(class_path, filename), image_size))
+                labels.append(label)
+            except OSError as e:
+                print(f"Erreur avec l'image {filename}: {e}")
+    return np.stack(images), np.array(labels)
+
+
+# Mesures pour un modèle, exécutées dans un processus neuf pour que la mémoire soit comparable
+def _benchmark_one(model_path, test_dir, runs, batch_size):
+    from model_registry import read_metadata
+
+    metadata = read_metadata(model_path)
+    class_names = metadata['class_names'] or sorted(os.listdir(test_dir))
+    images, labels = _load_labelled_images(test_dir, metadata['image_size'], class_names)
+    rss_before = _rss_mb()
+
+    start = time.perf_counter()
+    model = load_predictor(model_path)
+    load_s = time.perf_counter() - start
+
+    model.predict(images[:1], verbose=0) # Préchauffage
+    latencies = []
+    for i in range(runs):
+        start = time.perf_counter()
+        model.predict(images[i % len(images)][None], verbose=0)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    predictions = np.concatenate([np.asarray(model.predict(images[i:i + batch_size], verbose=0))
+                                  for i in range(0, len(images), batch_size)])
+    throughput = len(images) / (time.perf_counter() - start)
+
+    return {
+        'model': os.path.basename(model_path),
+        'size_mb': os.path.getsize(model_path) / (1024 * 1024),
+        'load_s': load_s,
+        'latency_ms': float(np.median(latencies)) * 1000,
+        'images_per_s': throughput,
+        'rss_mb': _rss_mb() - rss_before,
+        'accuracy': float(np.mean(np.argmax(predictions, axis=1) == labels)),
+    }
+
+
+# Compare plusieurs modèles (Keras et/ou TFLite) sur un même dossier de test
+def benchmark(model_paths, test_dir, runs=50, batch_size=64):
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for model_path in model_paths:
+        with context.Pool(1) as pool:
+            results.append(pool.apply(_benchmark_one, (model_path, test_dir, runs, batch_size)))
+    return results
+
+
+def print_report(results):
+    header = f"{'Modèle':<36} {'Taille Mo':>10} {'Chargement s':>13} {'Latence ms':>11} {'Images/s':>10} {'RSS Mo':>8} {'Précision':>10}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['model']:<36} {r['size_mb']:>10.2f} {r['load_s']:>13.3f} {r['latency_ms']:>11.2f} "
+              f"{r['images_per_s']:>10.1f} {r['rss_mb']:>8.1f} {r['accuracy']:>10.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de modèles Keras / TFLite")
+    parser.add_argument('models', nargs='+', help="Fichiers .keras, .h5 ou .tflite")
+    parser.add_argument('--test-dir', default='./Images_split/test')
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--quantize', nargs='*', choices=QUANTIZED_VARIANTS,
+                        help="Exporte d'abord les modèles Keras dans ces variantes quantifiées")
+    parser.add_argument('--representative-dir', default='./Images_split/val')
+    parser.add_argument('--num-samples', type=int, default=200)
+    args = parser.parse_args()
+
+    model_paths = list(args.models)
+    if args.quantize is not None:
+        from model_registry import read_metadata
+        for model_path in args.models:
+            if model_path.endswith('.tflite'):
+                continue
+            metadata = read_metadata(model_path)
+            model_paths += quantize_model(load_predictor(model_path), os.path.splitext(model_path)[0],
+                                          metadata['input_shape'], metadata['class_names'] or [],
+                                          args.quantize, args.representative_dir, args.num_samples,
+                                          metadata['stats'])
+
+    print_report(benchmark(model_paths, args.test_dir, args.runs, args.batch_size))
@@ -0,0 +1,87 @@
+# Registre des modèles sauvegardés. Chaque modèle a un fichier de métadonnées à côté de lui
+# (cnn_model_32x32.keras -> cnn_model_32x32.json) avec la forme d'entrée, les noms de classes
+# dans l'ordre de class_indices, l'empreinte du fichier et les statistiques d'entraînement.
+# ModelRegistry garde les derniers modèles chargés en mémoire (LRU) pour que repasser d'une
+# variante à l'autre soit instantané après le premier chargement.
+import os
+import re
+import json
+import threading
+from collections import OrderedDict
+
+from prediction_cache import file_sha256, model_fingerprint
+from lite_predictor import load_predictor
+
+# Classes des modèles livrés dans CNN_models, qui n'ont pas de fichier de métadonnées
+DEFAULT_CLASS_NAMES = ["Bulbasaur", "Charmander", "Pikachu", "Squirtle"]
+
+
+# Chemin du fichier de métadonnées d'un modèle
+def metadata_path(model_path):
+    return os.path.splitext(model_path)[0] + '.json'
+
+
+# Écrit les métadonnées d'un modèle qui vient d'être sauvegardé
+def write_metadata(model_path, input_shape, class_names, stats=None):
+    metadata = {
+        'input_shape': list(input_shape),
+        'class_names': list(class_names),
+        'sha256': file_sha256(model_path),
+        'stats': stats or {},
+    }
+    with open(metadata_path(model_path), 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return metadata
+
+
+# Lit les métadonnées d'un modèle. Sans fichier de métadonnées (anciens modèles), la taille
+# d'entrée est déduite du nom du fichier ({largeur}x{hauteur}) et les classes sont inconnues.
+# L'empreinte enregistrée n'est réutilisée que si les métadonnées sont plus récentes que le modèle.
+def read_metadata(model_path):
+    path = metadata_path(model_path)
+    if os.path.exists(path):
+        with open(path) as f:
+            metadata = json.load(f)
+        if os.path.getmtime(path) < os.path.getmtime(model_path):
+            metadata['sha256'] = file_sha256(model_path)
+    else:
+        m = re.search(r'(\d+)x(\d+)', os.path.basename(model_path))
+        if m is None:
+            raise ValueError(f"Taille d'entrée introuvable pour {model_path} (ni métadonnées, ni NxN dans le nom)")
+        metadata = {
+            'input_shape': [int(m.group(2)), int(m.group(1)), 3],
+            'class_names': None,
+            'sha256': file_sha256(model_path),
+            'stats': {},
+        }
+
+    height, width = metadata['input_shape'][:2]
+    metadata['image_size'] = (width, height) # Ordre (largeur, hauteur) de PIL
+    metadata['model_key'] = model_fingerprint(model_path, (height, width), sha256=metadata['sha256'])
+    return metadata
+
+
+class ModelRegistry:
+    def __init__(self, max_models=4, loader=None):
+        self.max_models = max_models
+        self.loader = loader or load_predictor # Keras ou TFLite selon l'extension
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Renvoie (modèle, métadonnées), depuis le cache si le fichier n'a pas changé
+    def get(self, model_path):
+        key = (os.path.abspath(model_path), os.path.getmtime(model_path))
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+
+            entry = (self.loader(model_path), read_metadata(model_path))
+            self._models[key] = entry
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+            return entry
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
@@ -0,0 +1,186 @@
+# Format de jeu de données compacté : chaque split (train, val, test) est un dossier contenant
+#   images.npy   : tableau uint8 (N, H, W, 3), lu via numpy.memmap
+#   labels.npy   : tableau int32 (N,) des indices de classe
+#   classes.json : en-tête {"class_indices": {...}, "image_size": [H, W], "count": N}
+# Les images sont décodées une seule fois à l'écriture ; à l'entraînement un batch n'est
+# qu'une tranche contiguë du memmap, sans décodage JPEG ni accès aux métadonnées des fichiers.
+# DirectorySequence lit les splits non compactés (dossiers ou index) avec le même prétraitement.
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from tqdm import tqdm
+from tensorflow.keras.utils import Sequence
+
+from image_loading import load_image
+from preprocessing import BatchBuffer, normalize_into, SCALE
+from split_index import list_class_images
+
+IMAGES_FILE = 'images.npy'
+LABELS_FILE = 'labels.npy'
+HEADER_FILE = 'classes.json'
+
+
+# Décode une image en uint8 (H, W, 3), ou None si elle est illisible
+def _load_uint8(img_path, image_size):
+    height, width = image_size
+    try:
+        return load_image(img_path, (width, height))
+    except Exception as e:
+        print(f"Erreur avec l'image {img_path}: {e}")
+        return None
+
+
+# Écrit un split au format compacté. Les échantillons sont mélangés une fois à l'écriture
+# (seed fixe) pour que des tranches contiguës du memmap contiennent des classes variées.
+def write_packed(source_dir, output_dir, image_size, class_indices=None, seed=42, workers=8):
+    samples, class_indices = list_class_images(source_dir, class_indices)
+    order = np.random.default_rng(seed).permutation(len(samples))
+    samples = [samples[i] for i in order]
+
+    os.makedirs(output_dir, exist_ok=True)
+    height, width = image_size
+    images = np.lib.format.open_memmap(os.path.join(output_dir, IMAGES_FILE), mode='w+',
+                                       dtype=np.uint8, shape=(len(samples), height, width, 3))
+    labels = np.zeros(len(samples), dtype=np.int32)
+
+    count = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        arrays = executor.map(lambda s: _load_uint8(s[0], image_size), samples)
+        for (img_path, label), arr in tqdm(zip(samples, arrays), total=len(samples)):
+            if arr is None:
+                continue
+            images[count] = arr
+            labels[count] = label
+            count += 1
+    images.flush()
+    del images
+
+    np.save(os.path.join(output_dir, LABELS_FILE), labels[:count])
+    with open(os.path.join(output_dir, HEADER_FILE), 'w') as f:
+        json.dump({'class_indices': class_indices, 'image_size': [height, width], 'count': count}, f, indent=2)
+    return class_indices
+
+
+# Ouvre un split compacté en lecture seule : (images memmap, labels, en-tête)
+def open_packed(packed_dir):
+    with open(os.path.join(packed_dir, HEADER_FILE)) as f:
+        header = json.load(f)
+    count = header['count']
+    images = np.load(os.path.join(packed_dir, IMAGES_FILE), mmap_mode='r')[:count]
+    labels = np.load(os.path.join(packed_dir, LABELS_FILE))
+    return images, labels, header
+
+
+# Séquence Keras sur un split compacté. Expose class_indices, classes et samples comme
+# les itérateurs de flow_from_directory pour que le reste de CNNTrainer fonctionne tel quel.
+# Le mélange se fait au niveau des batches pour garder des tranches contiguës du memmap.
+# augmenter (par ex. augmentation.BatchAugmenter) est appliqué à chaque batch après rescale.
+class PackedSequence(Sequence):
+    def __init__(self, packed_dir, batch_size=64, rescale=1./255, shuffle=True, seed=None, augmenter=None, **kwargs):
+        super().__init__(**kwargs)
+        self.images, self.classes, header = open_packed(packed_dir)
+        self.class_indices = header['class_indices']
+        self.num_classes = len(self.class_indices)
+        self.samples = len(self.classes)
+        self.image_shape = tuple(header['image_size']) + (3,)
+        self.batch_size = batch_size
+        self.rescale = rescale
+        self.shuffle = shuffle
+        self.augmenter = augmenter
+        self._rng = np.random.default_rng(seed)
+        self._batch_order = np.arange(len(self))
+        self.on_epoch_end()
+
+    def __len__(self):
+        return (self.samples + self.batch_size - 1) // self.batch_size
+
+    def _batch_slice(self, idx):
+        start = self._batch_order[idx] * self.batch_size
+        return slice(start, min(start + self.batch_size, self.samples))
+
+    # Tranche brute uint8 du memmap (vue, sans copie) et ses labels
+    def raw_batch(self, idx):
+        s = self._batch_slice(idx)
+        return self.images[s], self.classes[s]
+
+    def __getitem__(self, idx):
+        x, y = self.raw_batch(idx)
+        x = normalize_into(x, np.empty(x.shape, dtype=np.float32), self.rescale)
+        if self.augmenter is not None:
+            x = self.augmenter(x)
+        return x, np.eye(self.num_classes, dtype=np.float32)[y]
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self._rng.shuffle(self._batch_order)
+
+
+# Séquence Keras sur un dossier de classes (ou un index de split) qui remplace
+# flow_from_directory : mêmes attributs (class_indices, classes, samples) et target_size
+# (hauteur, largeur), mais les images passent par preprocessing, exactement comme à la
+# prédiction. Chaque batch est alloué une fois puis rempli en place par decode_threads
+# threads ; il n'est pas réutilisé, Keras pouvant en garder plusieurs en vol. Une image
+# illisible est signalée une fois puis toujours sautée, et retirée de classes et samples
+# pour qu'ils correspondent à ce que la séquence produit (matrice de confusion).
+class DirectorySequence(Sequence):
+    def __init__(self, directory, target_size, batch_size=64, scale=SCALE, shuffle=True, seed=None,
+                 class_indices=None, decode_threads=4, **kwargs):
+        super().__init__(**kwargs)
+        samples, self.class_indices = list_class_images(directory, class_indices)
+        self.paths = [path for path, _ in samples]
+        self._labels = np.array([label for _, label in samples], dtype=np.int32)
+        self._failed = set() # Indices des images illisibles
+        self.num_classes = len(self.class_indices)
+        height, width = target_size
+        self.image_size = (width, height)
+        self.batch_size = batch_size
+        self.scale = scale
+        self.shuffle = shuffle
+        self.decode_threads = decode_threads
+        self._executor = None
+        self._rng = np.random.default_rng(seed)
+        self._order = np.arange(len(self.paths))
+        self.on_epoch_end()
+        print(f"{self.samples} images de {self.num_classes} classes dans {directory}")
+
+    # Indices de classe des images lisibles, dans l'ordre des fichiers
+    @property
+    def classes(self):
+        if not self._failed:
+            return self._labels
+        return np.delete(self._labels, sorted(self._failed))
+
+    @property
+    def samples(self):
+        return len(self.paths) - len(self._failed)
+
+    def __len__(self):
+        return (len(self.paths) + self.batch_size - 1) // self.batch_size
+
+    def __getitem__(self, idx):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.decode_threads)
+        indices = self._order[idx * self.batch_size:(idx + 1) * self.batch_size]
+        buffer = BatchBuffer(len(indices), self.image_size, self.scale)
+
+        def load(row):
+            index = indices[row]
+            if index in self._failed:
+                return False
+            try:
+                buffer.load_into(row, self.paths[index])
+                return True
+            except Exception as e:
+                print(f"Erreur avec l'image {self.paths[index]}: {e}")
+                self._failed.add(index)
+                return False
+
+        rows = [row for row, ok in enumerate(self._executor.map(load, range(len(indices)))) if ok]
+        labels = self._labels[indices[rows]]
+        return buffer.rows(rows), np.eye(self.num_classes, dtype=np.float32)[labels]
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self._rng.shuffle(self._order)
@@ -0,0 +1,96 @@
+# Cache des prédictions indexé par le contenu de l'image et l'identité du modèle.
+# Une même image (même octets) déjà passée dans le même modèle (même fichier, même taille
+# d'entrée) est resservie sans refaire la passe avant. Éviction LRU au-delà de max_entries
+# et persistance optionnelle dans un fichier JSON.
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Empreinte SHA-256 d'un fichier, lue par blocs
+def file_sha256(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Identité d'un modèle : empreinte du fichier et taille d'entrée. sha256 évite de relire
+# le fichier quand l'empreinte est déjà connue (métadonnées du registre de modèles).
+def model_fingerprint(model_path, input_size, sha256=None):
+    return f"{sha256 or file_sha256(model_path)}:{'x'.join(str(n) for n in input_size)}"
+
+
+# Empreinte du contenu d'une image
+def image_key(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class PredictionCache:
+    def __init__(self, max_entries=4096, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self._entries = OrderedDict()
+        self._file_keys = {}
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Probabilités déjà calculées pour cette image et ce modèle, ou None
+    def get(self, model_key, img_key):
+        with self._lock:
+            probabilities = self._entries.get((model_key, img_key))
+            if probabilities is not None:
+                self._entries.move_to_end((model_key, img_key))
+            return probabilities
+
+    def put(self, model_key, img_key, probabilities):
+        with self._lock:
+            self._entries[(model_key, img_key)] = np.array(probabilities, dtype=np.float32)
+            self._entries.move_to_end((model_key, img_key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # Empreinte du contenu d'un fichier local, mémorisée par (chemin, mtime, taille) pour
+    # ne pas relire un fichier inchangé. Égale à image_key() de ses octets.
+    def file_key(self, path):
+        st = os.stat(path)
+        stamp = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+        key = self._file_keys.get(stamp)
+        if key is None:
+            key = file_sha256(path)
+            if len(self._file_keys) >= self.max_entries:
+                self._file_keys.clear()
+            self._file_keys[stamp] = key
+        return key
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def load(self):
+        with open(self.path) as f:
+            data = json.load(f)
+        with self._lock:
+            for model_key, img_key, probabilities in data[-self.max_entries:]:
+                self._entries[(model_key, img_key)] = np.array(probabilities, dtype=np.float32)
+
+    # Écrit le cache (du moins au plus récemment utilisé) de façon atomique
+    def save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            data = [[model_key, img_key, probabilities.tolist()]
+                    for (model_key, img_key), probabilities in self._entries.items()]
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,59 @@
+# Prétraitement unique des images pour le modèle, partagé par l'entraînement
+# (DirectorySequence, PackedSequence, tf.data), la prédiction (CNNTrainer, classify, serve)
+# et l'interface : décodage et redimensionnement par image_loading (conversion RGB avant le
+# resize, taille (largeur, hauteur)), puis normalisation x * (1/255) en float32 écrite
+# directement dans une ligne d'un batch préalloué. Les mêmes octets donnent ainsi exactement
+# le même tenseur partout, sans tableau float intermédiaire par image.
+import threading
+
+import numpy as np
+
+from image_loading import load_image
+
+SCALE = np.float32(1 / 255)
+
+
+# Normalise une image uint8 (H, W, 3) dans out (float32, même forme) et renvoie out
+def normalize_into(img, out, scale=SCALE):
+    return np.multiply(img, np.float32(scale), out=out)
+
+
+# Image normalisée (H, W, 3) float32 à la taille image_size = (largeur, hauteur).
+# out : ligne d'un batch (ou tout tableau float32 de cette forme) à remplir.
+def preprocess_image(source, image_size, out=None, scale=SCALE, backend='pil'):
+    width, height = image_size
+    if out is None:
+        out = np.empty((height, width, 3), dtype=np.float32)
+    return normalize_into(load_image(source, image_size, backend=backend), out, scale)
+
+
+# Batch float32 (batch_size, H, W, 3) alloué une fois et rempli ligne par ligne, éventuellement
+# depuis plusieurs threads (chaque ligne est indépendante). Le backend 'cv2' décode dans un
+# tampon uint8 propre à chaque thread, réutilisé d'une image à l'autre.
+class BatchBuffer:
+    def __init__(self, batch_size, image_size, scale=SCALE, backend='pil'):
+        width, height = image_size
+        self.image_size = tuple(image_size)
+        self.scale = scale
+        self.backend = backend
+        self.array = np.empty((batch_size, height, width, 3), dtype=np.float32)
+        self._local = threading.local()
+
+    def _scratch(self):
+        scratch = getattr(self._local, 'scratch', None)
+        if scratch is None:
+            scratch = self._local.scratch = np.empty(self.array.shape[1:], dtype=np.uint8)
+        return scratch
+
+    # Décode source dans la ligne i ; lève OSError si l'image est illisible
+    def load_into(self, i, source):
+        scratch = self._scratch() if self.backend == 'cv2' else None
+        img = load_image(source, self.image_size, out=scratch, backend=self.backend)
+        return normalize_into(img, self.array[i], self.scale)
+
+    # Batch formé des lignes `rows` : vue sans copie quand ce sont les premières lignes
+    def rows(self, rows):
+        rows = list(rows)
+        if rows == list(range(len(rows))):
+            return self.array[:len(rows)]
+        return self.array[rows]
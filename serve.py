@@ -0,0 +1,414 @@
+# Service HTTP local de prédiction autour d'un modèle entraîné (.keras, .h5 ou .tflite).
+# Les requêtes concurrentes sont regroupées en micro-batches (au plus max_batch_size images,
+# au plus max_wait_ms d'attente après la première) pour un seul appel au modèle.
+#
+#   python serve.py CNN_models/cnn_model_32x32.keras --port 8000
+#
+#   POST /predict, corps = octets de l'image (Content-Type image/jpeg, image/png...)
+#       curl --data-binary @pikachu.jpg -H 'Content-Type: image/jpeg' http://127.0.0.1:8000/predict
+#   POST /predict, corps JSON {"url": "https://..."}
+#   -> {"class": "Pikachu", "probabilities": {"Bulbizarre": 0.01, ...}, "cached": false}
+#   GET /health -> modèle servi et statistiques des micro-batches
+#
+# Mode multi-processus (--workers N, Linux / macOS) : le processus principal ouvre le port puis
+# crée N workers par fork, avant tout import de TensorFlow. Chaque worker accepte les connexions
+# sur la socket partagée (le noyau réveille un worker libre par connexion) avec son propre
+# micro-batching. Le modèle est servi en TFLite : le fichier est projeté en mémoire par chaque
+# interpréteur, si bien que les poids ne sont présents qu'une fois en RAM (cache de pages)
+# quel que soit N, à l'exception de la copie réarrangée que garde XNNPACK dans chaque worker
+# (--no-xnnpack la supprime, au prix d'inférences plus lentes). Un modèle Keras est d'abord
+# converti en {nom}_float32.tflite.
+#   python serve.py CNN_models/cnn_model_256x256.keras --workers 4
+#
+# Test de charge (latences p50 / p90 / p99 et requêtes/s) contre un service lancé :
+#   python serve.py --load-test http://127.0.0.1:8000/predict --images Images_split/test --concurrency 16
+# (service lancé avec --cache-entries 0, sinon les images répétées sortent du cache)
+import os
+import json
+import time
+import queue
+import socket
+import signal
+import argparse
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.request import Request, urlopen
+
+import numpy as np
+
+from fetch import ImageFetcher
+from prediction_cache import PredictionCache, image_key
+from model_registry import read_metadata
+from lite_predictor import load_predictor, quantize_model
+from image_loading import load_image, BACKENDS
+from preprocessing import normalize_into
+
+MAX_BODY_BYTES = 20 * 1024 * 1024
+
+
+# Regroupe les images soumises par plusieurs threads en batches pour predict_fn.
+# submit() prend une image uint8 (H, W, 3) et renvoie un Future de ses probabilités ; les
+# images sont normalisées directement dans un batch float32 alloué une fois.
+class MicroBatcher:
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=5):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.images = 0
+        self._buffer = None # (max_batch_size, H, W, 3) float32, créé à la première image
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, array):
+        future = Future()
+        self._queue.put((array, future))
+        return future
+
+    # Attend une première image, puis complète le batch jusqu'à max_batch_size ou max_wait
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=max(remaining, 0)) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None: # Arrêt : on traite d'abord ce qui a été reçu
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                if self._buffer is None or self._buffer.shape[1:] != batch[0][0].shape:
+                    self._buffer = np.empty((self.max_batch_size,) + batch[0][0].shape, dtype=np.float32)
+                for i, (array, _) in enumerate(batch):
+                    normalize_into(array, self._buffer[i])
+                probabilities = np.asarray(self.predict_fn(self._buffer[:len(batch)]))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.images += len(batch)
+            for (_, future), probs in zip(batch, probabilities):
+                future.set_result(probs)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+
+# Modèle servi : décodage des images, cache des prédictions et micro-batching
+class InferenceService:
+    def __init__(self, model_path, class_names=None, max_batch_size=32, max_wait_ms=5, timeout=30,
+                 cache_entries=4096, num_threads=None, xnnpack=True, backend='pil'):
+        metadata = read_metadata(model_path)
+        self.model_path = model_path
+        self.image_size = metadata['image_size']
+        self.model_key = metadata['model_key']
+        self.class_names = class_names or metadata['class_names']
+        self.timeout = timeout
+        self.backend = backend
+        self.model = load_predictor(model_path, num_threads, xnnpack)
+        if self.class_names is None:
+            num_classes = int(np.asarray(self.model.predict_on_batch(np.zeros((1,) + self.input_shape(), np.float32))).shape[-1])
+            self.class_names = [str(i) for i in range(num_classes)]
+        self.fetcher = ImageFetcher()
+        self.prediction_cache = PredictionCache(max_entries=cache_entries)
+        self.batcher = MicroBatcher(self.model.predict_on_batch, max_batch_size, max_wait_ms)
+
+    def input_shape(self):
+        width, height = self.image_size
+        return (height, width, 3)
+
+    # Image uint8 (H, W, 3) à partir de ses octets ; le MicroBatcher la normalise comme
+    # CNNTrainer.predict_image (voir preprocessing)
+    def _decode(self, data):
+        return load_image(data, self.image_size, backend=self.backend)
+
+    # Classe et probabilités d'une image (octets) ; ValueError si elle est illisible
+    def predict(self, data):
+        img_key = image_key(data)
+        probabilities = self.prediction_cache.get(self.model_key, img_key)
+        cached = probabilities is not None
+        if not cached:
+            try:
+                array = self._decode(data)
+            except OSError as e:
+                raise ValueError(f"Image illisible : {e}")
+            probabilities = self.batcher.submit(array).result(self.timeout)
+            self.prediction_cache.put(self.model_key, img_key, probabilities)
+        return {
+            'class': self.class_names[int(np.argmax(probabilities))],
+            'probabilities': {name: float(p) for name, p in zip(self.class_names, probabilities)},
+            'cached': cached,
+        }
+
+    def stats(self):
+        return {
+            'model': os.path.basename(self.model_path),
+            'pid': os.getpid(),
+            'image_size': list(self.image_size),
+            'classes': self.class_names,
+            'batches': self.batcher.batches,
+            'images': self.batcher.images,
+            'mean_batch_size': self.batcher.images / max(self.batcher.batches, 1),
+        }
+
+    def close(self):
+        self.batcher.close()
+        self.fetcher.close()
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive pour les clients qui enchaînent les requêtes
+    service = None
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, self.service.stats())
+        else:
+            self._send_json(404, {'error': "Chemin inconnu"})
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self._send_json(404, {'error': "Chemin inconnu"})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send_json(413, {'error': f"Image trop volumineuse (> {MAX_BODY_BYTES} octets)"})
+            return
+        body = self.rfile.read(length)
+
+        try:
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                url = json.loads(body)['url']
+                try:
+                    body = self.service.fetcher.fetch(url)
+                except Exception as e:
+                    self._send_json(502, {'error': f"Téléchargement impossible : {e}"})
+                    return
+            self._send_json(200, self.service.predict(body))
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {'error': str(e)})
+        except Exception as e:
+            self._send_json(500, {'error': repr(e)})
+
+    def log_message(self, format, *args): # Pas de ligne de log par requête
+        pass
+
+
+class PredictionServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128 # File d'attente de connexions assez longue pour les pics de requêtes
+
+
+def make_server(service, host='127.0.0.1', port=8000):
+    handler = type('BoundPredictionHandler', (PredictionHandler,), {'service': service})
+    return PredictionServer((host, port), handler)
+
+
+# Conversion d'un modèle Keras en TFLite float32, dans un processus à part pour que le
+# processus principal du mode multi-processus n'importe jamais TensorFlow
+def _convert_to_tflite(model_path, output_stem):
+    metadata = read_metadata(model_path)
+    quantize_model(load_predictor(model_path), output_stem, metadata['input_shape'],
+                   metadata['class_names'] or [], variants=(), stats=metadata['stats'])
+
+
+# Fichier TFLite à servir pour model_path : lui-même, ou sa conversion float32 (réutilisée
+# tant qu'elle est plus récente que le modèle Keras)
+def tflite_model_for(model_path):
+    if model_path.endswith('.tflite'):
+        return model_path
+    output_stem = os.path.splitext(model_path)[0]
+    tflite_path = output_stem + '_float32.tflite'
+    if not os.path.exists(tflite_path) or os.path.getmtime(tflite_path) < os.path.getmtime(model_path):
+        process = multiprocessing.get_context('spawn').Process(target=_convert_to_tflite,
+                                                               args=(model_path, output_stem))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            raise RuntimeError(f"Conversion TFLite de {model_path} impossible (code {process.exitcode})")
+    return tflite_path
+
+
+# Corps d'un worker (processus fils) : charge le modèle et sert sur la socket héritée
+def _worker_main(listen_socket, model_path, service_options):
+    signal.signal(signal.SIGTERM, signal.default_int_handler) # Arrêt propre sur SIGTERM
+    service = InferenceService(model_path, **service_options)
+    handler = type('BoundPredictionHandler', (PredictionHandler,), {'service': service})
+    server = PredictionServer(listen_socket.getsockname()[:2], handler, bind_and_activate=False)
+    server.socket.close()
+    server.socket = listen_socket
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+# Sert model_path avec `workers` processus partageant la socket et le fichier du modèle.
+# Un worker qui s'arrête est relancé, sauf s'il meurt au démarrage (modèle illisible...).
+def serve_prefork(model_path, host='127.0.0.1', port=8000, workers=2, **service_options):
+    if not hasattr(os, 'fork'):
+        raise ValueError("Le mode multi-processus demande os.fork (Linux, macOS)")
+    model_path = tflite_model_for(model_path)
+    service_options.setdefault('num_threads', max(1, (os.cpu_count() or 1) // workers))
+    listen_socket = socket.create_server((host, port), backlog=PredictionServer.request_queue_size)
+
+    children = {} # pid -> heure de lancement
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _worker_main(listen_socket, model_path, service_options)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            os._exit(code)
+        children[pid] = time.monotonic()
+
+    for _ in range(workers):
+        spawn()
+    print(f"Service {os.path.basename(model_path)} sur http://{host}:{port}/predict ({workers} workers)")
+    try:
+        while children:
+            pid, status = os.wait()
+            started = children.pop(pid)
+            if time.monotonic() - started < 5:
+                print(f"Le worker {pid} s'est arrêté au démarrage (statut {status}), arrêt du service")
+                break
+            print(f"Worker {pid} arrêté (statut {status}), relancé")
+            spawn()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        listen_socket.close()
+
+
+# Envoie `requests` images (réparties sur les fichiers de images_dir) avec `concurrency`
+# clients simultanés et mesure les latences
+def load_test(url, images_dir, requests=500, concurrency=16):
+    paths = sorted(os.path.join(root, f) for root, _, files in os.walk(images_dir) for f in files
+                   if not f.startswith('.') and not f.endswith('.txt'))
+    if not paths:
+        raise ValueError(f"Aucune image dans {images_dir}")
+    bodies = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            bodies.append(f.read())
+
+    def send(i):
+        start = time.perf_counter()
+        request = Request(url, data=bodies[i % len(bodies)], headers={'Content-Type': 'application/octet-stream'})
+        try:
+            with urlopen(request, timeout=60) as response:
+                response.read()
+            ok = True
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([latency for latency, ok in results if ok]) * 1000
+    return {
+        'requests': requests,
+        'errors': sum(not ok for _, ok in results),
+        'concurrency': concurrency,
+        'requests_per_s': requests / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+        'p90_ms': float(np.percentile(latencies, 90)) if len(latencies) else None,
+        'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+    }
+
+
+def print_load_test(result):
+    print(f"{result['requests']} requêtes ({result['errors']} erreurs), {result['concurrency']} clients : "
+          f"{result['requests_per_s']:.1f} requêtes/s")
+    if result['p50_ms'] is not None:
+        print(f"Latence p50 {result['p50_ms']:.1f} ms, p90 {result['p90_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Service HTTP de prédiction avec micro-batching")
+    parser.add_argument('model', nargs='?', help="Fichier .keras, .h5 ou .tflite à servir")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    parser.add_argument('--cache-entries', type=int, default=4096,
+                        help="Taille du cache des prédictions (0 pour le désactiver, par ex. en test de charge)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Processus servant le modèle (> 1 : mode multi-processus sur un modèle TFLite partagé)")
+    parser.add_argument('--no-xnnpack', dest='xnnpack', action='store_false',
+                        help="Modèles TFLite sans XNNPACK : poids partagés entre workers, inférence plus lente")
+    parser.add_argument('--backend', choices=BACKENDS, default='pil',
+                        help="Décodage des images (cv2 : plus rapide, pixels un peu différents de l'entraînement)")
+    parser.add_argument('--classes', nargs='+', help="Noms des classes, si le modèle n'a pas de métadonnées")
+    parser.add_argument('--load-test', metavar='URL', help="Lance un test de charge contre ce service au lieu de servir")
+    parser.add_argument('--images', default='./Images_split/test', help="Images envoyées par le test de charge")
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    if args.load_test:
+        print_load_test(load_test(args.load_test, args.images, args.requests, args.concurrency))
+    elif args.model is None:
+        parser.error("un modèle est requis pour servir")
+    elif args.workers > 1:
+        serve_prefork(args.model, args.host, args.port, args.workers, class_names=args.classes,
+                      max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms,
+                      cache_entries=args.cache_entries, xnnpack=args.xnnpack, backend=args.backend)
+    else:
+        service = InferenceService(args.model, args.classes, args.max_batch_size, args.max_wait_ms,
+                                   cache_entries=args.cache_entries, xnnpack=args.xnnpack, backend=args.backend)
+        server = make_server(service, args.host, args.port)
+        print(f"Service {os.path.basename(args.model)} sur http://{args.host}:{args.port}/predict")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            service.close()
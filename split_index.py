@@ -0,0 +1,66 @@
+# Splits sous forme de fichiers d'index ({split}.txt, une ligne "classe<TAB>chemin" par image)
+# ou de dossiers de classes, et liste des images d'un split. Sans TensorFlow : utilisé aussi
+# par les outils NumPy / PIL comme dedup.py.
+import os
+
+from image_loading import IMAGE_EXTENSIONS
+
+INDEX_SUFFIX = '.txt'
+
+
+# Écrit un fichier d'index de split : une ligne "classe<TAB>chemin" par image, le chemin
+# étant relatif au dossier de l'index pour que l'ensemble reste déplaçable
+def write_index(index_path, samples):
+    base = os.path.dirname(os.path.abspath(index_path))
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for img_path, class_name in samples:
+            f.write(f"{class_name}\t{os.path.relpath(os.path.abspath(img_path), base)}\n")
+    os.replace(tmp_path, index_path)
+
+
+# Lit un fichier d'index de split : [(chemin, classe)]
+def read_index(index_path):
+    base = os.path.dirname(os.path.abspath(index_path))
+    samples = []
+    with open(index_path, encoding='utf-8') as f:
+        for line in f:
+            class_name, rel_path = line.rstrip('\n').split('\t', 1)
+            samples.append((os.path.normpath(os.path.join(base, rel_path)), class_name))
+    return samples
+
+
+# Source d'un split dans base_dir : l'index {split}.txt s'il existe, sinon le dossier {split}
+def split_source(base_dir, split):
+    index_path = os.path.join(base_dir, split + INDEX_SUFFIX)
+    return index_path if os.path.isfile(index_path) else os.path.join(base_dir, split)
+
+
+# Liste les images d'un dossier organisé en sous-dossiers de classes (ordre alphabétique,
+# comme flow_from_directory) ou d'un fichier d'index, et renvoie [(chemin, indice_classe)]
+# et class_indices. Seuls les fichiers d'extension d'image comptent (pas de .DS_Store ni
+# de notes.txt)
+def list_class_images(source_dir, class_indices=None):
+    if os.path.isfile(source_dir):
+        indexed = read_index(source_dir)
+        if class_indices is None:
+            class_indices = {name: i for i, name in enumerate(sorted({c for _, c in indexed}))}
+        samples = sorted(((path, class_indices[c]) for path, c in indexed
+                          if c in class_indices and path.lower().endswith(IMAGE_EXTENSIONS)),
+                         key=lambda s: (s[1], s[0]))
+        return samples, class_indices
+
+    if class_indices is None:
+        class_names = sorted(d for d in os.listdir(source_dir) if os.path.isdir(os.path.join(source_dir, d)))
+        class_indices = {name: i for i, name in enumerate(class_names)}
+
+    samples = []
+    for class_name, index in class_indices.items():
+        class_path = os.path.join(source_dir, class_name)
+        if not os.path.isdir(class_path):
+            continue
+        for filename in sorted(os.listdir(class_path)):
+            img_path = os.path.join(class_path, filename)
+            if filename.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(img_path):
+                samples.append((img_path, index))
+    return samples, class_indices
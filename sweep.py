@@ -0,0 +1,149 @@
+# Entraîne plusieurs résolutions (et combinaisons d'hyperparamètres) en parallèle, un processus
+# par entraînement. Chaque processus est limité à son propre groupe de cœurs (affinité CPU et
+# pools de threads TensorFlow) pour que les entraînements ne se marchent pas dessus.
+# Chaque modèle est écrit sous cnn_model_{N}x{N}.keras avec ses métadonnées et métriques
+# (.json), puis un tableau récapitulatif est affiché.
+#
+#   python sweep.py --sizes 32 64 128 256 --data-dir Images_split --epochs 10 --parallel 4
+#
+# TensorFlow n'est importé que dans les processus d'entraînement, après le réglage des threads.
+import os
+import json
+import time
+import queue
+import argparse
+import itertools
+import multiprocessing
+
+
+# Nom du fichier d'un modèle ; les hyperparamètres qui varient dans le balayage y sont ajoutés
+def _model_name(job, varying):
+    name = f"cnn_model_{job['size']}x{job['size']}"
+    if 'batch_size' in varying:
+        name += f"_bs{job['batch_size']}"
+    if 'architecture' in varying:
+        name += f"_{job['architecture']}"
+    return name
+
+
+# Découpe les cœurs disponibles en `parallel` groupes disjoints
+def _cpu_slots(parallel):
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+    parallel = max(1, min(parallel, len(cpus)))
+    return [cpus[i::parallel] for i in range(parallel)]
+
+
+# Exécuté dans un processus neuf : limite les threads, entraîne, évalue et sauvegarde
+def _run_job(job, cpus, results):
+    threads = str(len(cpus))
+    os.environ['OMP_NUM_THREADS'] = threads
+    os.environ['TF_NUM_INTRAOP_THREADS'] = threads
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+
+    start = time.perf_counter()
+    try:
+        from code_final import CNNModel, CNNTrainer
+
+        size = job['size']
+        trainer = CNNTrainer(model=CNNModel(architecture=job['architecture']),
+                             img_height=size, img_width=size, batch_size=job['batch_size'])
+        if job['fast']:
+            trainer.configure_fast_training(intra_op_threads=len(cpus), inter_op_threads=1)
+        trainer.prepare_datasets(job['data_dir'].format(size=size))
+        trainer.build_model()
+        trainer.train(epochs=job['epochs'], early_stopping_patience=job['patience'])
+        trainer.evaluate()
+        trainer.save_model(job['model_path'])
+
+        results.put(dict(job, test_accuracy=trainer.train_stats['test_accuracy'],
+                         train_time_s=trainer.train_stats['train_time_s'],
+                         model_size_mb=os.path.getsize(job['model_path']) / (1024 * 1024),
+                         wall_time_s=time.perf_counter() - start, error=None))
+    except Exception as e:
+        results.put(dict(job, wall_time_s=time.perf_counter() - start, error=repr(e)))
+
+
+# Lance tous les entraînements, `parallel` à la fois, et renvoie leurs résultats
+def run_sweep(sizes, data_dir, output_dir, epochs=10, batch_sizes=(64,), architectures=('flatten',),
+              parallel=None, fast=False, patience=None):
+    os.makedirs(output_dir, exist_ok=True)
+    grid = {'size': sizes, 'batch_size': batch_sizes, 'architecture': architectures}
+    varying = {key for key, values in grid.items() if len(values) > 1}
+
+    jobs = []
+    for size, batch_size, architecture in itertools.product(sizes, batch_sizes, architectures):
+        job = {'size': size, 'batch_size': batch_size, 'architecture': architecture, 'epochs': epochs,
+               'data_dir': data_dir, 'fast': fast, 'patience': patience}
+        job['name'] = _model_name(job, varying)
+        job['model_path'] = os.path.join(output_dir, job['name'] + '.keras')
+        jobs.append(job)
+
+    context = multiprocessing.get_context('spawn')
+    results_queue = context.Queue()
+    free_slots = _cpu_slots(parallel or len(jobs))
+    running = {} # nom du job -> (processus, groupe de cœurs)
+    results = []
+
+    while jobs or running:
+        while jobs and free_slots:
+            job = jobs.pop(0)
+            cpus = free_slots.pop(0)
+            process = context.Process(target=_run_job, args=(job, cpus, results_queue))
+            process.start()
+            running[job['name']] = (process, cpus)
+            print(f"Lancé {job['name']} sur les cœurs {cpus}")
+
+        try:
+            result = results_queue.get(timeout=1)
+        except queue.Empty: # Un processus mort sans résultat (plantage natif, mémoire...) libère son slot
+            for name, (process, cpus) in list(running.items()):
+                if not process.is_alive() and process.exitcode != 0:
+                    del running[name]
+                    free_slots.append(cpus)
+                    results.append({'name': name, 'error': f"processus terminé avec le code {process.exitcode}"})
+                    print(f"Terminé {name} (erreur : code {process.exitcode})")
+            continue
+
+        process, cpus = running.pop(result['name'])
+        process.join()
+        free_slots.append(cpus)
+        results.append(result)
+        print(f"Terminé {result['name']}" + (f" (erreur : {result['error']})" if result['error'] else ""))
+
+    with open(os.path.join(output_dir, 'sweep_summary.json'), 'w') as f:
+        json.dump(results, f, indent=2)
+    return results
+
+
+def print_summary(results):
+    header = f"{'Modèle':<36} {'Précision test':>15} {'Entraînement s':>15} {'Taille Mo':>10}"
+    print(header)
+    print('-' * len(header))
+    for r in sorted(results, key=lambda r: r['name']):
+        if r['error']:
+            print(f"{r['name']:<36} erreur : {r['error']}")
+        else:
+            print(f"{r['name']:<36} {r['test_accuracy']:>15.3f} {r['train_time_s']:>15.1f} {r['model_size_mb']:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entraînement de plusieurs résolutions en parallèle")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[32, 64, 128, 256])
+    parser.add_argument('--data-dir', default='./Images_split',
+                        help="Dossier train/val/test, peut contenir {size} (par ex. Images_split_{size})")
+    parser.add_argument('--output-dir', default='./CNN_models')
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[64])
+    parser.add_argument('--architectures', nargs='+', default=['flatten'], choices=['flatten', 'gap'])
+    parser.add_argument('--parallel', type=int, default=None, help="Entraînements simultanés (défaut : tous)")
+    parser.add_argument('--fast', action='store_true', help="Active configure_fast_training dans chaque job")
+    parser.add_argument('--patience', type=int, default=None, help="Patience de l'arrêt anticipé")
+    args = parser.parse_args()
+
+    print_summary(run_sweep(args.sizes, args.data_dir, args.output_dir, args.epochs, args.batch_sizes,
+                            args.architectures, args.parallel, args.fast, args.patience))